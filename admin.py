@@ -0,0 +1,749 @@
+"""Admin panel."""
+import csv
+import io
+import json
+import os
+from datetime import datetime, timedelta
+
+from flask import (Blueprint, abort, current_app, flash, jsonify, redirect, render_template, request, send_file,
+                   session, stream_with_context, url_for)
+from flask_limiter.util import get_remote_address
+from sqlalchemy import delete, select, update
+
+from app import db
+from models import (User, Category, Gallery, PhotoTag, PortfolioItem, Review, Comment, Rating, Request, SiteCounter,
+                    RequestDayCount)
+from pagination import keyset_paginate
+from passwords import HasherBusy
+from portfolio import (delete_portfolio_items, import_portfolio_files, reindex_portfolio_items, apply_rating_delta,
+                       parse_tag_names, set_portfolio_tags)
+from uploads import image_jobs, store_upload, upload_files, release_uploads, queue_image_processing
+from web import (limiter, password_hasher, route_stats, profile_store, cached_categories, cached_galleries,
+                 cached_tags, category_choices, gallery_choices)
+
+admin_bp = Blueprint('admin', __name__)
+
+@admin_bp.route('/admin', methods=['GET', 'POST'])
+@limiter.limit("5 per minute")
+def admin_login():
+    from admin_forms import LoginForm
+    form = LoginForm()
+    if form.validate_on_submit():
+        user = db.session.execute(select(User.id, User.password_hash)
+                                  .where(User.username == form.username.data)).first()
+        # Don't hold a pooled connection while the hash is computed
+        db.session.close()
+        try:
+            valid = user is not None and password_hasher.verify(user.password_hash, form.password.data)
+        except HasherBusy:
+            flash('Слишком много попыток входа, попробуйте через минуту.', 'error')
+            return render_template('admin/login.html', form=form), 503, {'Retry-After': '60'}
+        if valid:
+            if password_hasher.needs_rehash(user.password_hash):
+                # Hash parameters changed since this password was stored; skip if it changed meanwhile
+                try:
+                    db.session.execute(update(User).where(User.id == user.id,
+                                                          User.password_hash == user.password_hash)
+                                       .values(password_hash=password_hasher.hash(form.password.data)))
+                    db.session.commit()
+                except HasherBusy:
+                    pass
+            # Store admin session info
+            session['admin_logged_in'] = True
+            # Clear failed login attempts for this IP after successful login
+            session.pop(f'failed_logins_{get_remote_address()}', None)
+            return redirect(url_for('.admin_dashboard'))
+        else:
+            # Track failed login attempts
+            failed_attempts = session.get(f'failed_logins_{get_remote_address()}', 0)
+            session[f'failed_logins_{get_remote_address()}'] = failed_attempts + 1
+            flash('Неверный логин или пароль', 'error')
+    return render_template('admin/login.html', form=form)
+
+@admin_bp.route('/register', methods=['GET', 'POST'])
+def register():
+    from admin_forms import RegistrationForm
+    form = RegistrationForm()
+    if form.validate_on_submit():
+        user = User(username=form.username.data)
+        user.set_password(form.password.data)
+        db.session.add(user)
+        db.session.commit()
+        flash('Регистрация прошла успешно! Теперь вы можете войти.', 'success')
+        return redirect(url_for('.admin_login'))
+    return render_template('admin/register.html', form=form)
+
+# Dashboard chart windows in days, and the days summed into one bar for each
+CHART_WINDOWS = (30, 90, 365)
+CHART_BAR_DAYS = {30: 1, 90: 3, 365: 7}
+
+def request_volume(days):
+    """Requests per bar over the last days (UTC), read from the daily buckets"""
+    last = datetime.utcnow().date()
+    first = last - timedelta(days=days - 1)
+    per_day = dict(db.session.execute(select(RequestDayCount.day, RequestDayCount.count)
+                                      .where(RequestDayCount.day >= first)).all())
+    bar_days = CHART_BAR_DAYS[days]
+    bars = []
+    # Bars end today; the oldest one may cover fewer days
+    end = last
+    while end >= first:
+        start = max(end - timedelta(days=bar_days - 1), first)
+        count = sum(per_day.get(start + timedelta(days=offset), 0) for offset in range((end - start).days + 1))
+        bars.append({'start': start, 'end': end, 'count': count})
+        end = start - timedelta(days=1)
+    bars.reverse()
+    return {'days': days, 'bars': bars, 'total': sum(bar['count'] for bar in bars),
+            'peak': max(bar['count'] for bar in bars)}
+
+@admin_bp.route('/admin/dashboard')
+def admin_dashboard():
+    if not session.get('admin_logged_in'):
+        return redirect(url_for('.admin_login'))
+    
+    days = request.args.get('days', type=int)
+    if days not in CHART_WINDOWS:
+        days = CHART_WINDOWS[0]
+    # Counters and day buckets are kept up to date by the writes; nothing here scans the counted tables
+    counters = dict(db.session.execute(select(SiteCounter.name, SiteCounter.value)).all())
+    chart = request_volume(days)
+    recent_requests = db.session.scalars(select(Request).options(db.joinedload(Request.category))
+                                         .order_by(Request.created_at.desc(), Request.id.desc()).limit(5)).all()
+    
+    return render_template('admin/dashboard.html', 
+                          total_requests=counters.get('request', 0), 
+                          total_portfolio=counters.get('portfolio_item', 0), 
+                          total_reviews=counters.get('review', 0),
+                          total_comments=counters.get('comment', 0),
+                          total_ratings=counters.get('rating', 0),
+                          categories=cached_categories(),
+                          chart=chart, chart_windows=CHART_WINDOWS,
+                          recent_requests=recent_requests)
+
+@admin_bp.route('/admin/categories')
+def admin_categories():
+    if not session.get('admin_logged_in'):
+        return redirect(url_for('.admin_login'))
+    
+    categories = cached_categories()
+    return render_template('admin/categories.html', categories=categories)
+
+@admin_bp.route('/admin/categories/add', methods=['GET', 'POST'])
+def admin_add_category():
+    if not session.get('admin_logged_in'):
+        return redirect(url_for('.admin_login'))
+    
+    from admin_forms import CategoryForm
+    form = CategoryForm()
+    if form.validate_on_submit():
+        filename = None
+        if form.image.data:
+            filename = store_upload(form.image.data)
+        
+        category = Category(
+            name=form.name.data,
+            description=form.description.data,
+            duration=form.duration.data,
+            price=form.price.data,
+            image_filename=filename
+        )
+        db.session.add(category)
+        if filename:
+            queue_image_processing(category)
+        db.session.commit()
+        image_jobs.wake()
+        flash('Категория успешно добавлена!', 'success')
+        return redirect(url_for('.admin_categories'))
+    
+    return render_template('admin/category_form.html', form=form, title='Добавить категорию')
+
+@admin_bp.route('/admin/categories/edit/<int:id>', methods=['GET', 'POST'])
+def admin_edit_category(id):
+    if not session.get('admin_logged_in'):
+        return redirect(url_for('.admin_login'))
+    
+    category = Category.query.get_or_404(id)
+    from admin_forms import CategoryForm
+    form = CategoryForm(obj=category)
+    
+    if form.validate_on_submit():
+        replaced_files = []
+        if form.image.data:
+            # The old image is released once nothing references it
+            replaced_files.append(upload_files(category))
+            category.image_filename = store_upload(form.image.data)
+            queue_image_processing(category)
+        
+        category.name = form.name.data
+        category.description = form.description.data
+        category.duration = form.duration.data
+        category.price = form.price.data
+        
+        db.session.commit()
+        release_uploads(replaced_files)
+        image_jobs.wake()
+        flash('Категория успешно обновлена!', 'success')
+        return redirect(url_for('.admin_categories'))
+    
+    return render_template('admin/category_form.html', form=form, title='Редактировать категорию', category=category)
+
+@admin_bp.route('/admin/categories/delete/<int:id>', methods=['POST'])
+def admin_delete_category(id):
+    if not session.get('admin_logged_in'):
+        return redirect(url_for('.admin_login'))
+    
+    category = Category.query.get_or_404(id)
+    
+    # Delete associated portfolio items and the category image
+    released_files = delete_portfolio_items(PortfolioItem.category_id == category.id)
+    released_files.append(upload_files(category))
+    
+    db.session.execute(update(Request).where(Request.category_id == category.id).values(category_id=None)
+                       .execution_options(synchronize_session=False))
+    db.session.execute(delete(Category).where(Category.id == category.id)
+                       .execution_options(synchronize_session=False))
+    db.session.commit()
+    release_uploads(released_files)
+    flash('Категория успешно удалена!', 'success')
+    return redirect(url_for('.admin_categories'))
+
+@admin_bp.route('/admin/portfolio')
+def admin_portfolio():
+    if not session.get('admin_logged_in'):
+        return redirect(url_for('.admin_login'))
+    
+    portfolio_items = PortfolioItem.query.all()
+    categories = cached_categories()
+    galleries = cached_galleries()
+    return render_template('admin/portfolio.html', portfolio_items=portfolio_items, categories=categories, galleries=galleries)
+
+@admin_bp.route('/admin/portfolio/add', methods=['GET', 'POST'])
+def admin_add_portfolio():
+    if not session.get('admin_logged_in'):
+        return redirect(url_for('.admin_login'))
+    
+    from admin_forms import PortfolioForm
+    form = PortfolioForm()
+    form.category_id.choices = category_choices()
+    form.gallery_id.choices = gallery_choices()
+    
+    if form.validate_on_submit():
+        filename = store_upload(form.image.data)
+        
+        portfolio_item = PortfolioItem(
+            title=form.title.data,
+            description=form.description.data,  # New field
+            category_id=form.category_id.data,
+            gallery_id=form.gallery_id.data if form.gallery_id.data else None,  # Handle empty selection
+            image_filename=filename
+        )
+        db.session.add(portfolio_item)
+        queue_image_processing(portfolio_item)
+        
+        set_portfolio_tags(portfolio_item, parse_tag_names(form.tags.data))
+        
+        reindex_portfolio_items([portfolio_item])
+        db.session.commit()
+        image_jobs.wake()
+        flash('Работа успешно добавлена!', 'success')
+        return redirect(url_for('.admin_portfolio'))
+    
+    return render_template('admin/portfolio_form.html', form=form, title='Добавить работу')
+
+@admin_bp.route('/admin/portfolio/import', methods=['GET', 'POST'])
+def admin_import_portfolio():
+    if not session.get('admin_logged_in'):
+        return redirect(url_for('.admin_login'))
+    
+    from admin_forms import BulkPortfolioForm
+    form = BulkPortfolioForm()
+    form.category_id.choices = category_choices()
+    form.gallery_id.choices = gallery_choices()
+    # The import page posts files in chunks with XHR and reads JSON back
+    wants_json = request.accept_mimetypes.best == 'application/json'
+    
+    if form.validate_on_submit():
+        created, skipped = import_portfolio_files(form.images.data, form.title.data, form.description.data,
+                                                  form.category_id.data, form.gallery_id.data or None,
+                                                  parse_tag_names(form.tags.data))
+        if wants_json:
+            return jsonify({'created': created,
+                            'skipped': [{'filename': filename, 'reason': reason} for filename, reason in skipped]})
+        flash(f'Добавлено работ: {len(created)}, пропущено файлов: {len(skipped)}.', 'success')
+        return redirect(url_for('.admin_portfolio'))
+    if wants_json and request.method == 'POST':
+        return jsonify({'errors': form.errors}), 400
+    
+    return render_template('admin/portfolio_import.html', form=form, title='Массовая загрузка')
+
+@admin_bp.route('/admin/portfolio/import/status')
+def admin_import_status():
+    if not session.get('admin_logged_in'):
+        return redirect(url_for('.admin_login'))
+    
+    ids = [int(value) for value in request.args.get('ids', '').split(',') if value.isdigit()][:1000]
+    rows = db.session.execute(select(PortfolioItem.id, PortfolioItem.processing_status)
+                              .where(PortfolioItem.id.in_(ids))).all()
+    return jsonify({'items': {str(item_id): status for item_id, status in rows}})
+
+@admin_bp.route('/admin/portfolio/edit/<int:id>', methods=['GET', 'POST'])
+def admin_edit_portfolio(id):
+    if not session.get('admin_logged_in'):
+        return redirect(url_for('.admin_login'))
+    
+    portfolio_item = PortfolioItem.query.get_or_404(id)
+    from admin_forms import PortfolioForm
+    form = PortfolioForm(obj=portfolio_item)
+    form.category_id.choices = category_choices()
+    form.gallery_id.choices = gallery_choices()
+    
+    if form.validate_on_submit():
+        replaced_files = []
+        if form.image.data:
+            # The old image is released once nothing references it
+            replaced_files.append(upload_files(portfolio_item))
+            portfolio_item.image_filename = store_upload(form.image.data)
+            queue_image_processing(portfolio_item)
+        
+        portfolio_item.title = form.title.data
+        portfolio_item.description = form.description.data  # Update description
+        portfolio_item.category_id = form.category_id.data
+        portfolio_item.gallery_id = form.gallery_id.data if form.gallery_id.data else None  # Handle empty selection
+        
+        set_portfolio_tags(portfolio_item, parse_tag_names(form.tags.data))
+        
+        reindex_portfolio_items([portfolio_item])
+        db.session.commit()
+        release_uploads(replaced_files)
+        image_jobs.wake()
+        flash('Работа успешно обновлена!', 'success')
+        return redirect(url_for('.admin_portfolio'))
+    
+    # Pre-populate tags field
+    form.tags.data = ', '.join([tag.name for tag in portfolio_item.tags])
+    
+    return render_template('admin/portfolio_form.html', form=form, title='Редактировать работу', portfolio_item=portfolio_item)
+
+@admin_bp.route('/admin/portfolio/delete/<int:id>', methods=['POST'])
+def admin_delete_portfolio(id):
+    if not session.get('admin_logged_in'):
+        return redirect(url_for('.admin_login'))
+    
+    portfolio_item = PortfolioItem.query.get_or_404(id)
+    
+    # The image file and its derivatives go once no other row uses them
+    released_files = delete_portfolio_items(PortfolioItem.id == portfolio_item.id)
+    db.session.commit()
+    release_uploads(released_files)
+    flash('Работа успешно удалена!', 'success')
+    return redirect(url_for('.admin_portfolio'))
+
+@admin_bp.route('/admin/reviews')
+def admin_reviews():
+    if not session.get('admin_logged_in'):
+        return redirect(url_for('.admin_login'))
+    
+    reviews = Review.query.order_by(Review.date.desc()).all()
+    return render_template('admin/reviews.html', reviews=reviews)
+
+@admin_bp.route('/admin/reviews/add', methods=['GET', 'POST'])
+def admin_add_review():
+    if not session.get('admin_logged_in'):
+        return redirect(url_for('.admin_login'))
+    
+    from admin_forms import ReviewForm
+    form = ReviewForm()
+    
+    if form.validate_on_submit():
+        review = Review(
+            client_name=form.client_name.data,
+            text=form.text.data
+        )
+        db.session.add(review)
+        db.session.commit()
+        flash('Отзыв успешно добавлен!', 'success')
+        return redirect(url_for('.admin_reviews'))
+    
+    return render_template('admin/review_form.html', form=form, title='Добавить отзыв')
+
+@admin_bp.route('/admin/reviews/edit/<int:id>', methods=['GET', 'POST'])
+def admin_edit_review(id):
+    if not session.get('admin_logged_in'):
+        return redirect(url_for('.admin_login'))
+    
+    review = Review.query.get_or_404(id)
+    from admin_forms import ReviewForm
+    form = ReviewForm(obj=review)
+    
+    if form.validate_on_submit():
+        review.client_name = form.client_name.data
+        review.text = form.text.data
+        db.session.commit()
+        flash('Отзыв успешно обновлен!', 'success')
+        return redirect(url_for('.admin_reviews'))
+    
+    return render_template('admin/review_form.html', form=form, title='Редактировать отзыв', review=review)
+
+@admin_bp.route('/admin/reviews/delete/<int:id>', methods=['POST'])
+def admin_delete_review(id):
+    if not session.get('admin_logged_in'):
+        return redirect(url_for('.admin_login'))
+    
+    review = Review.query.get_or_404(id)
+    db.session.delete(review)
+    db.session.commit()
+    flash('Отзыв успешно удален!', 'success')
+    return redirect(url_for('.admin_reviews'))
+
+REQUESTS_PER_PAGE = 50
+EXPORT_COLUMNS = ('id', 'created_at', 'client_name', 'phone', 'category', 'message')
+
+def parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d')
+
+def request_filters():
+    """Conditions for the request listing filters in request.args, plus the filters to carry into links"""
+    date_from = request.args.get('date_from', type=parse_date)
+    date_to = request.args.get('date_to', type=parse_date)
+    category_id = request.args.get('category_id', type=int)
+    text_query = request.args.get('q', '', type=str).strip()
+    
+    conditions = []
+    if date_from:
+        conditions.append(Request.created_at >= date_from)
+    if date_to:
+        # The end date is inclusive
+        conditions.append(Request.created_at < date_to + timedelta(days=1))
+    if category_id:
+        conditions.append(Request.category_id == category_id)
+    if text_query:
+        pattern = f'%{text_query}%'
+        conditions.append(db.or_(Request.client_name.ilike(pattern), Request.phone.ilike(pattern),
+                                 Request.message.ilike(pattern)))
+    filter_args = {key: value for key, value in
+                   (('date_from', date_from and date_from.strftime('%Y-%m-%d')),
+                    ('date_to', date_to and date_to.strftime('%Y-%m-%d')),
+                    ('category_id', category_id), ('q', text_query))
+                   if value}
+    return conditions, filter_args
+
+@admin_bp.route('/admin/requests')
+def admin_requests():
+    if not session.get('admin_logged_in'):
+        return redirect(url_for('.admin_login'))
+    
+    conditions, filter_args = request_filters()
+    # One query for the page, categories included
+    query = Request.query.filter(*conditions).options(db.joinedload(Request.category))
+    keyset = keyset_paginate(query, Request.created_at, Request.id, REQUESTS_PER_PAGE,
+                             after=request.args.get('cursor'), before=request.args.get('before'))
+    categories = cached_categories()
+    return render_template('admin/requests.html', requests=keyset.items, keyset=keyset,
+                           filter_args=filter_args, categories=categories)
+
+@admin_bp.route('/admin/requests/export')
+def admin_export_requests():
+    if not session.get('admin_logged_in'):
+        return redirect(url_for('.admin_login'))
+    
+    export_format = request.args.get('format', 'csv')
+    if export_format not in ('csv', 'jsonl'):
+        return jsonify({'error': 'format must be csv or jsonl'}), 400
+    conditions, _ = request_filters()
+    statement = (select(Request.id, Request.created_at, Request.client_name, Request.phone,
+                        Category.name.label('category'), Request.message)
+                 .outerjoin(Category, Request.category_id == Category.id)
+                 .where(*conditions)
+                 .order_by(Request.created_at.desc(), Request.id.desc())
+                 .execution_options(yield_per=500))
+    
+    def generate():
+        # Rows come from the database cursor in batches and leave as soon as they are formatted
+        rows = db.session.execute(statement)
+        if export_format == 'jsonl':
+            for row in rows:
+                record = row._asdict()
+                record['created_at'] = row.created_at.isoformat() if row.created_at else None
+                yield json.dumps(record, ensure_ascii=False) + '\n'
+            return
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        buffer.write('\ufeff')  # Lets Excel detect UTF-8
+        writer.writerow(EXPORT_COLUMNS)
+        # The header goes out even when no row matches the filters
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        for row in rows:
+            writer.writerow([row.id, row.created_at.strftime('%Y-%m-%d %H:%M:%S') if row.created_at else '',
+                             row.client_name, row.phone, row.category or '', row.message or ''])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    
+    filename = f'requests-{datetime.utcnow():%Y%m%d-%H%M}.{export_format}'
+    mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    return current_app.response_class(stream_with_context(generate()), mimetype=mimetype,
+                                      headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+@admin_bp.route('/admin/galleries')
+def admin_galleries():
+    if not session.get('admin_logged_in'):
+        return redirect(url_for('.admin_login'))
+    
+    galleries = cached_galleries()
+    return render_template('admin/galleries.html', galleries=galleries)
+
+@admin_bp.route('/admin/galleries/add', methods=['GET', 'POST'])
+def admin_add_gallery():
+    if not session.get('admin_logged_in'):
+        return redirect(url_for('.admin_login'))
+    
+    from admin_forms import GalleryForm
+    form = GalleryForm()
+    if form.validate_on_submit():
+        # Get the first admin user as the owner (in a real app, you'd use the logged-in user)
+        admin_user = User.query.filter_by(is_admin=True).first()
+        if not admin_user:
+            admin_user = User.query.first()  # Fallback to first user if no admin
+        
+        gallery = Gallery(
+            name=form.name.data,
+            description=form.description.data,
+            user_id=admin_user.id
+        )
+        db.session.add(gallery)
+        db.session.commit()
+        flash('Галерея успешно добавлена!', 'success')
+        return redirect(url_for('.admin_galleries'))
+    
+    return render_template('admin/gallery_form.html', form=form, title='Добавить галерею')
+
+@admin_bp.route('/admin/galleries/edit/<int:id>', methods=['GET', 'POST'])
+def admin_edit_gallery(id):
+    if not session.get('admin_logged_in'):
+        return redirect(url_for('.admin_login'))
+    
+    gallery = Gallery.query.get_or_404(id)
+    from admin_forms import GalleryForm
+    form = GalleryForm(obj=gallery)
+    
+    if form.validate_on_submit():
+        gallery.name = form.name.data
+        gallery.description = form.description.data
+        db.session.commit()
+        flash('Галерея успешно обновлена!', 'success')
+        return redirect(url_for('.admin_galleries'))
+    
+    return render_template('admin/gallery_form.html', form=form, title='Редактировать галерею', gallery=gallery)
+
+@admin_bp.route('/admin/galleries/delete/<int:id>', methods=['POST'])
+def admin_delete_gallery(id):
+    if not session.get('admin_logged_in'):
+        return redirect(url_for('.admin_login'))
+    
+    gallery = Gallery.query.get_or_404(id)
+    
+    # Delete all photos in this gallery
+    released_files = delete_portfolio_items(PortfolioItem.gallery_id == gallery.id)
+    db.session.execute(delete(Gallery).where(Gallery.id == gallery.id)
+                       .execution_options(synchronize_session=False))
+    db.session.commit()
+    release_uploads(released_files)
+    flash('Галерея успешно удалена!', 'success')
+    return redirect(url_for('.admin_galleries'))
+
+@admin_bp.route('/admin/tags')
+def admin_tags():
+    if not session.get('admin_logged_in'):
+        return redirect(url_for('.admin_login'))
+    
+    tags = cached_tags()
+    return render_template('admin/tags.html', tags=tags)
+
+@admin_bp.route('/admin/tags/add', methods=['GET', 'POST'])
+def admin_add_tag():
+    if not session.get('admin_logged_in'):
+        return redirect(url_for('.admin_login'))
+    
+    from admin_forms import TagForm
+    form = TagForm()
+    if form.validate_on_submit():
+        tag = PhotoTag(name=form.name.data)
+        try:
+            db.session.add(tag)
+            db.session.commit()
+            flash('Тег успешно добавлен!', 'success')
+            return redirect(url_for('.admin_tags'))
+        except Exception as e:
+            db.session.rollback()
+            flash('Тег с таким именем уже существует!', 'error')
+    
+    return render_template('admin/tag_form.html', form=form, title='Добавить тег')
+
+@admin_bp.route('/admin/tags/edit/<int:id>', methods=['GET', 'POST'])
+def admin_edit_tag(id):
+    if not session.get('admin_logged_in'):
+        return redirect(url_for('.admin_login'))
+    
+    tag = PhotoTag.query.get_or_404(id)
+    from admin_forms import TagForm
+    form = TagForm(obj=tag)
+    
+    if form.validate_on_submit():
+        tag.name = form.name.data
+        try:
+            reindex_portfolio_items(tag.photos)
+            db.session.commit()
+            flash('Тег успешно обновлен!', 'success')
+            return redirect(url_for('.admin_tags'))
+        except Exception as e:
+            db.session.rollback()
+            flash('Тег с таким именем уже существует!', 'error')
+    
+    return render_template('admin/tag_form.html', form=form, title='Редактировать тег', tag=tag)
+
+@admin_bp.route('/admin/tags/delete/<int:id>', methods=['POST'])
+def admin_delete_tag(id):
+    if not session.get('admin_logged_in'):
+        return redirect(url_for('.admin_login'))
+    
+    tag = PhotoTag.query.get_or_404(id)
+    reindex_portfolio_items(tag.photos, exclude_tag=tag)
+    db.session.delete(tag)
+    db.session.commit()
+    flash('Тег успешно удален!', 'success')
+    return redirect(url_for('.admin_tags'))
+
+@admin_bp.route('/admin/comments')
+def admin_comments():
+    if not session.get('admin_logged_in'):
+        return redirect(url_for('.admin_login'))
+    
+    comments = Comment.query.options(db.joinedload(Comment.portfolio_item)).order_by(Comment.created_at.desc()).all()
+    return render_template('admin/comments.html', comments=comments)
+
+@admin_bp.route('/admin/comments/delete/<int:id>', methods=['POST'])
+def admin_delete_comment(id):
+    if not session.get('admin_logged_in'):
+        return redirect(url_for('.admin_login'))
+    
+    comment = Comment.query.get_or_404(id)
+    db.session.delete(comment)
+    db.session.commit()
+    flash('Комментарий успешно удален!', 'success')
+    return redirect(url_for('.admin_comments'))
+
+RATINGS_PER_PAGE = 50
+
+@admin_bp.route('/admin/ratings')
+def admin_ratings():
+    if not session.get('admin_logged_in'):
+        return redirect(url_for('.admin_login'))
+    
+    sort = request.args.get('sort', 'average')
+    if sort == 'count':
+        order = (PortfolioItem.rating_count.desc(), PortfolioItem.rating_average.desc())
+    else:
+        sort = 'average'
+        order = (PortfolioItem.rating_average.desc(), PortfolioItem.rating_count.desc())
+    # Read straight from the rating indexes on the denormalised aggregates
+    top_items = (PortfolioItem.query.filter(PortfolioItem.rating_count > 0)
+                 .order_by(*order).limit(50).all())
+    # Newest ratings first, one primary key range per page
+    keyset = keyset_paginate(Rating.query.options(db.joinedload(Rating.portfolio_item)), None, Rating.id,
+                             RATINGS_PER_PAGE, after=request.args.get('cursor'), before=request.args.get('before'))
+    return render_template('admin/ratings.html', ratings=keyset.items, keyset=keyset, top_items=top_items,
+                           sort=sort)
+
+@admin_bp.route('/admin/ratings/delete/<int:id>', methods=['POST'])
+def admin_delete_rating(id):
+    if not session.get('admin_logged_in'):
+        return redirect(url_for('.admin_login'))
+    
+    rating = Rating.query.get_or_404(id)
+    db.session.delete(rating)
+    apply_rating_delta(rating.portfolio_item_id, -1, -rating.score)
+    db.session.commit()
+    flash('Рейтинг успешно удален!', 'success')
+    return redirect(url_for('.admin_ratings'))
+
+# Orders offered on the diagnostics page: totals over all requests of a route, or its worst request
+DIAGNOSTICS_SORTS = ('db_time', 'queries', 'max_queries', 'n_plus_one', 'time')
+
+@admin_bp.route('/admin/diagnostics')
+def admin_diagnostics():
+    if not session.get('admin_logged_in'):
+        return redirect(url_for('.admin_login'))
+    
+    sort = request.args.get('sort', DIAGNOSTICS_SORTS[0])
+    if sort not in DIAGNOSTICS_SORTS:
+        sort = DIAGNOSTICS_SORTS[0]
+    routes = route_stats.worst(limit=50, key=sort)
+    return render_template('admin/diagnostics.html', routes=routes, sort=sort, pid=os.getpid(),
+                           enabled=current_app.config['SQL_STATS'],
+                           threshold=current_app.config['N_PLUS_ONE_THRESHOLD'])
+
+@admin_bp.route('/admin/diagnostics/reset', methods=['POST'])
+def admin_reset_diagnostics():
+    if not session.get('admin_logged_in'):
+        return redirect(url_for('.admin_login'))
+    
+    route_stats.reset()
+    flash('Статистика запросов сброшена.', 'success')
+    return redirect(url_for('.admin_diagnostics'))
+
+@admin_bp.route('/admin/profiles')
+def admin_profiles():
+    if not session.get('admin_logged_in'):
+        return redirect(url_for('.admin_login'))
+    
+    return render_template('admin/profiles.html', profiles=profile_store().list(),
+                           parameter=current_app.config['PROFILE_PARAMETER'],
+                           sample_rate=current_app.config['PROFILE_SAMPLE_RATE'])
+
+@admin_bp.route('/admin/profiles/<name>')
+def admin_profile(name):
+    if not session.get('admin_logged_in'):
+        return redirect(url_for('.admin_login'))
+    
+    profile = profile_store().load(name)
+    if profile is None:
+        abort(404)
+    return render_template('admin/profile.html', profile=profile)
+
+@admin_bp.route('/admin/profiles/<name>/download')
+def admin_download_profile(name):
+    if not session.get('admin_logged_in'):
+        return redirect(url_for('.admin_login'))
+    
+    extension = 'json' if request.args.get('format') == 'json' else 'folded'
+    path = profile_store().path(name, extension)
+    if path is None or not os.path.exists(path):
+        abort(404)
+    return send_file(path, mimetype='application/json' if extension == 'json' else 'text/plain',
+                     as_attachment=True, download_name=f'{name}.{extension}')
+
+@admin_bp.route('/admin/profiles/delete/<name>', methods=['POST'])
+def admin_delete_profile(name):
+    if not session.get('admin_logged_in'):
+        return redirect(url_for('.admin_login'))
+    
+    profile_store().delete(name)
+    flash('Профиль успешно удален!', 'success')
+    return redirect(url_for('.admin_profiles'))
+
+@admin_bp.route('/admin/profiles/clear', methods=['POST'])
+def admin_clear_profiles():
+    if not session.get('admin_logged_in'):
+        return redirect(url_for('.admin_login'))
+    
+    profile_store().clear()
+    flash('Все профили удалены.', 'success')
+    return redirect(url_for('.admin_profiles'))
+
+@admin_bp.route('/admin/logout')
+def admin_logout():
+    session.pop('admin_logged_in', None)
+    flash('Вы успешно вышли из системы.', 'success')
+    return redirect(url_for('.admin_login'))
@@ -0,0 +1,83 @@
+"""Forms of the admin panel, imported by its views on first use."""
+from flask_wtf import FlaskForm
+from wtforms import StringField, TextAreaField, SelectField, FileField, MultipleFileField, PasswordField, SubmitField
+from wtforms.validators import DataRequired, Length
+from wtforms import ValidationError
+
+from models import User
+
+class LoginForm(FlaskForm):
+    username = StringField('Логин', validators=[DataRequired()])
+    password = PasswordField('Пароль', validators=[DataRequired()])
+
+class RegistrationForm(FlaskForm):
+    username = StringField('Имя пользователя', validators=[DataRequired(), Length(min=4, max=20)])
+    password = PasswordField('Пароль', validators=[DataRequired(), Length(min=8)])
+    confirm_password = PasswordField('Подтвердите пароль', validators=[DataRequired()])
+    submit = SubmitField('Зарегистрироваться')
+    
+    def validate_username(self, username):
+        user = User.query.filter_by(username=username.data).first()
+        if user:
+            raise ValidationError('Это имя пользователя уже занято.')
+    
+    def validate_password(self, password):
+        # Check password complexity: at least 8 characters, with uppercase, lowercase, digit, and special character
+        pwd = password.data
+        if len(pwd) < 8:
+            raise ValidationError('Пароль должен содержать не менее 8 символов.')
+        
+        has_upper = any(c.isupper() for c in pwd)
+        has_lower = any(c.islower() for c in pwd)
+        has_digit = any(c.isdigit() for c in pwd)
+        has_special = any(c in "!@#$%^&*()_+-=[]{}|;:,.<>?" for c in pwd)
+        
+        if not (has_upper and has_lower and has_digit and has_special):
+            raise ValidationError('Пароль должен содержать хотя бы одну заглавную букву, одну строчную букву, одну цифру и один специальный символ.')
+    
+    def validate_confirm_password(self, confirm_password):
+        if self.password.data != confirm_password.data:
+            raise ValidationError('Пароли не совпадают.')
+
+class CategoryForm(FlaskForm):
+    name = StringField('Название', validators=[DataRequired(), Length(max=100)])
+    description = TextAreaField('Описание', validators=[DataRequired()])
+    duration = StringField('Продолжительность', validators=[Length(max=50)])
+    price = StringField('Цена', validators=[Length(max=50)])
+    image = FileField('Изображение')
+
+def coerce_empty_to_none(value):
+    """Coerce empty strings to None for gallery_id"""
+    if value == '' or value is None:
+        return None
+    return int(value)
+
+class PortfolioForm(FlaskForm):
+    title = StringField('Название', validators=[DataRequired(), Length(max=200)])
+    description = TextAreaField('Описание', validators=[Length(max=500)])  # New field for description
+    category_id = SelectField('Категория', coerce=int, validators=[DataRequired()])
+    gallery_id = SelectField('Галерея', coerce=coerce_empty_to_none)  # New field for gallery selection
+    tags = StringField('Теги (через запятую)', validators=[Length(max=200)])  # Field for tags
+    image = FileField('Изображение', validators=[DataRequired()])
+
+class BulkPortfolioForm(PortfolioForm):
+    title = StringField('Название (к нему добавится номер; по умолчанию имя файла)', validators=[Length(max=190)])
+    image = None
+    images = MultipleFileField('Изображения или ZIP-архивы', validators=[DataRequired()])
+
+class GalleryForm(FlaskForm):
+    name = StringField('Название галереи', validators=[DataRequired(), Length(max=100)])
+    description = TextAreaField('Описание', validators=[Length(max=500)])
+
+class TagForm(FlaskForm):
+    name = StringField('Название тега', validators=[DataRequired(), Length(max=50)])
+
+class ReviewForm(FlaskForm):
+    client_name = StringField('Имя клиента', validators=[DataRequired(), Length(max=100)])
+    text = TextAreaField('Отзыв', validators=[DataRequired()])
+
+class RequestForm(FlaskForm):
+    client_name = StringField('Имя клиента', validators=[DataRequired(), Length(max=100)])
+    phone = StringField('Телефон', validators=[DataRequired(), Length(max=20)])
+    category_id = SelectField('Категория', coerce=int)
+    message = TextAreaField('Сообщение')
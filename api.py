@@ -0,0 +1,137 @@
+"""JSON API used by the site's scripts."""
+import hashlib
+import json
+
+from flask import Blueprint, current_app, jsonify, request, stream_with_context
+from flask_limiter.util import get_remote_address
+
+from app import db
+from models import PortfolioItem, table_versions
+from pagination import KeysetStream
+from portfolio import RATING_SCORES, submit_rating, portfolio_query, search_portfolio, paginate_portfolio
+from uploads import image_url
+from web import limiter, page_cache
+
+api_bp = Blueprint('api', __name__, url_prefix='/api/v1')
+
+@api_bp.route('/portfolio/<int:id>/rating', methods=['POST'])
+@limiter.limit('30 per minute')
+def api_rate_portfolio_item(id):
+    data = request.get_json(silent=True) or request.form
+    try:
+        score = int(data.get('score'))
+    except (TypeError, ValueError):
+        score = None
+    if score not in RATING_SCORES:
+        return jsonify({'error': 'score must be an integer from 1 to 5'}), 400
+    
+    aggregates = submit_rating(id, get_remote_address(), score)
+    if aggregates is None:
+        return jsonify({'error': 'Portfolio item not found'}), 404
+    rating_count, rating_average = aggregates
+    return jsonify({'score': score, 'rating_count': rating_count, 'rating_average': rating_average})
+
+# API endpoints for frontend filtering
+@api_bp.route('/search')
+def api_search():
+    text_query = request.args.get('q', '', type=str).strip()
+    if not text_query:
+        return jsonify({'error': 'Parameter q is required'}), 400
+    per_page = min(max(request.args.get('limit', 24, type=int), 1), 100)
+    page = request.args.get('page', 1, type=int)
+    query = portfolio_query(request.args.get('category_id', type=int),
+                            request.args.get('gallery_id', type=int),
+                            request.args.get('tag', type=str))
+    query = search_portfolio(query.options(db.joinedload(PortfolioItem.category)), text_query)
+    results = query.paginate(page=page, per_page=per_page, error_out=False)
+    
+    return jsonify({
+        'query': text_query,
+        'items': [{
+            'id': item.id,
+            'title': item.title,
+            'description': item.description,
+            'image_url': image_url(item),
+            'thumbnail_url': image_url(item, 'thumb'),
+            'category_id': item.category_id,
+            'category_name': item.category.name
+        } for item in results.items],
+        'page': results.page,
+        'pages': results.pages,
+        'total': results.total
+    })
+
+# Fields of /api/v1/portfolio: serializer, columns to load and relationship loaders
+PORTFOLIO_API_FIELDS = {
+    'id': (lambda item: item.id, [], []),
+    'title': (lambda item: item.title, ['title'], []),
+    'description': (lambda item: item.description, ['description'], []),
+    'image_url': (lambda item: image_url(item), ['image_filename', 'image_variants'], []),
+    'thumbnail_url': (lambda item: image_url(item, 'thumb'), ['image_filename', 'image_variants'], []),
+    'category_id': (lambda item: item.category_id, ['category_id'], []),
+    'category_name': (lambda item: item.category.name, ['category_id'], [db.joinedload(PortfolioItem.category)]),
+    'gallery_id': (lambda item: item.gallery_id, ['gallery_id'], []),
+    'gallery_name': (lambda item: item.gallery.name if item.gallery else None, ['gallery_id'],
+                     [db.joinedload(PortfolioItem.gallery)]),
+    'tags': (lambda item: [tag.name for tag in item.tags], [], [db.selectinload(PortfolioItem.tags)]),
+    'created_at': (lambda item: item.created_at.isoformat(), [], []),
+}
+PORTFOLIO_API_DEFAULT_FIELDS = ('id', 'title', 'description', 'image_url', 'thumbnail_url',
+                                'category_id', 'category_name', 'gallery_id', 'created_at')
+PORTFOLIO_API_TABLES = ('portfolio_item', 'category', 'gallery', 'photo_tag', 'photo_tags')
+
+@api_bp.route('/portfolio')
+def api_portfolio():
+    """Portfolio items, newest first, one keyset page at a time.
+
+    Arguments: limit, cursor / before, category_id, gallery_id, tag and
+    fields (comma separated names from PORTFOLIO_API_FIELDS).
+    """
+    fields = request.args.get('fields', type=str)
+    fields = [f.strip() for f in fields.split(',') if f.strip()] if fields else list(PORTFOLIO_API_DEFAULT_FIELDS)
+    unknown = [f for f in fields if f not in PORTFOLIO_API_FIELDS]
+    if unknown:
+        return jsonify({'error': f'Unknown fields: {", ".join(unknown)}'}), 400
+    
+    # The response is fully determined by the code, the arguments and the data versions: revalidate without querying
+    fingerprint = json.dumps([page_cache.build, table_versions.versions(PORTFOLIO_API_TABLES),
+                              sorted(request.args.items(multi=True))])
+    etag = hashlib.sha256(fingerprint.encode()).hexdigest()[:32]
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        per_page = min(max(request.args.get('limit', 24, type=int), 1), current_app.config['API_MAX_PAGE_SIZE'])
+        query = portfolio_query(request.args.get('category_id', type=int),
+                                request.args.get('gallery_id', type=int),
+                                request.args.get('tag', type=str))
+        columns = {'id', 'created_at'}
+        for field in fields:
+            columns.update(PORTFOLIO_API_FIELDS[field][1])
+            query = query.options(*PORTFOLIO_API_FIELDS[field][2])
+        query = query.options(db.load_only(*(getattr(PortfolioItem, column) for column in columns)))
+        if 'tags' not in fields:
+            # The relationship's default subquery eager load can't be combined with batched fetching
+            query = query.options(db.lazyload(PortfolioItem.tags))
+        
+        if request.args.get('before'):
+            page = paginate_portfolio(query, per_page)
+        else:
+            page = KeysetStream(query, PortfolioItem.created_at, PortfolioItem.id, per_page,
+                                after=request.args.get('cursor'))
+        serializers = [(field, PORTFOLIO_API_FIELDS[field][0]) for field in fields]
+        
+        def generate():
+            # Serialise row by row so large pages never sit in memory as one document
+            yield '{"items":['
+            for index, item in enumerate(page):
+                row = json.dumps({field: serialize(item) for field, serialize in serializers})
+                yield row if index == 0 else ',' + row
+            yield '],"next_cursor":%s,"prev_cursor":%s}' % (json.dumps(page.next_cursor),
+                                                              json.dumps(page.prev_cursor))
+        
+        response = current_app.response_class(stream_with_context(generate()), mimetype='application/json')
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = current_app.config['PAGE_CACHE_MAX_AGE']
+    response.cache_control.s_maxage = current_app.config['PAGE_CACHE_SHARED_MAX_AGE']
+    return response
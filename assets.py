@@ -0,0 +1,127 @@
+"""Fingerprinted, precompressed static assets.
+
+build() copies each source under the static folder to a name made from
+a hash of its content (css/style.css -> dist/css/style.1a2b3c4d5e6f.css)
+and writes gzip and brotli copies next to it. dist/manifest.json maps
+every source name to its built name; AssetManifest reads it so the
+application can link the built files. A built file never changes under
+its name, so clients may cache it forever.
+
+CSS is minified by dropping comments and whitespace outside strings.
+JavaScript is copied as it is: without a parser a minifier can't tell a
+regular expression from a division or where a line break ends a
+statement, and the compressed copies already remove most of the weight.
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+SOURCES = ('css/style.css', 'js/script.js')
+
+_FINGERPRINT = re.compile(r'\.[0-9a-f]{12}\.\w+$')
+
+
+def _skip_string(text, i):
+    """Index just past the quoted string starting at text[i]"""
+    quote = text[i]
+    i += 1
+    while i < len(text) and text[i] != quote:
+        i += 2 if text[i] == '\\' else 1
+    return i + 1
+
+
+def minify_css(text):
+    """text without comments and redundant whitespace"""
+    out = []
+    i = 0
+    pending = False
+    while i < len(text):
+        char = text[i]
+        if char in ' \t\r\n':
+            pending = True
+            i += 1
+            continue
+        if text.startswith('/*', i):
+            end = text.find('*/', i + 2)
+            i = len(text) if end < 0 else end + 2
+            pending = True
+            continue
+        previous = out[-1][-1] if out else ''
+        # A space before ':' separates a descendant from a pseudo-class, so it stays
+        if pending and out and previous not in '{};:,>' and char not in '{};,>)':
+            out.append(' ')
+        pending = False
+        if char == '}' and previous == ';':
+            out[-1] = out[-1][:-1]
+        end = _skip_string(text, i) if char in '\'"' else i + 1
+        out.append(text[i:end])
+        i = end
+    return ''.join(out).strip() + '\n'
+
+
+MINIFIERS = {'.css': minify_css}
+
+
+def build(static_folder, sources=SOURCES):
+    """Build every source into static_folder/dist; returns the manifest"""
+    # Only builds need the compressor; the application just reads the manifest
+    try:
+        import brotli
+    except ImportError:
+        raise RuntimeError('The Brotli package is required to build static assets (pip install Brotli)')
+    dist = os.path.join(static_folder, DIST)
+    manifest = {}
+    for source in sources:
+        base, extension = os.path.splitext(source)
+        with open(os.path.join(static_folder, source), encoding='utf-8') as f:
+            content = f.read()
+        content = MINIFIERS.get(extension, str)(content).encode('utf-8')
+        name = f'{DIST}/{base}.{hashlib.sha256(content).hexdigest()[:12]}{extension}'
+        manifest[source] = name
+        path = os.path.join(static_folder, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        variants = {'': content, '.gz': gzip.compress(content, 9, mtime=0),
+                    '.br': brotli.compress(content, quality=11)}
+        for suffix, data in variants.items():
+            _write(path + suffix, data)
+
+    # Keep the previous build's files: pages rendered before a deploy still link them
+    _write(os.path.join(dist, MANIFEST), json.dumps(manifest, indent=2).encode('utf-8'))
+    return manifest
+
+
+def _write(path, data):
+    with open(path + '.part', 'wb') as f:
+        f.write(data)
+    os.replace(path + '.part', path)
+
+
+class AssetManifest:
+    """Built names of static files, read from the manifest on first use"""
+
+    def __init__(self, static_folder):
+        self.path = os.path.join(static_folder, DIST, MANIFEST)
+        self._names = None
+
+    def load(self):
+        """(Re)read the manifest; without one every file is served under its own name"""
+        try:
+            with open(self.path) as f:
+                self._names = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self._names = {}
+
+    def resolve(self, filename):
+        """Built name of a source file, or None if it has not been built"""
+        if self._names is None:
+            self.load()
+        return self._names.get(filename)
+
+    @staticmethod
+    def is_built(filename):
+        """True for a file of this or an earlier build, which never changes under its name"""
+        return filename.startswith(DIST + '/') and _FINGERPRINT.search(filename) is not None
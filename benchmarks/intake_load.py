@@ -0,0 +1,118 @@
+"""Request form submissions per second with direct and write-behind intake.
+
+Several processes, each with a few threads, post the quick request form
+through the Flask test client for a fixed time against a fresh SQLite
+database, first with REQUEST_INTAKE = 'direct' (one transaction per post)
+and then with 'journal' (posts are journaled and written in batches). For
+the journal mode it also reports how long the batch writer took to get
+every accepted request into the database after the load stopped.
+
+    python benchmarks/intake_load.py --processes 4 --threads 4 --seconds 10
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SETTINGS = '''
+WTF_CSRF_ENABLED = False
+RATELIMIT_ENABLED = False
+IMAGE_WORKERS = 0
+REQUEST_INTAKE = {mode!r}
+INTAKE_FOLDER = {intake!r}
+TABLE_VERSION_FOLDER = {versions!r}
+'''
+
+CHILD = '''
+import json, sys, threading, time
+import app as m
+m.create_app()
+start, seconds, threads = float(sys.argv[1]), float(sys.argv[2]), int(sys.argv[3])
+latencies, errors = [], []
+
+def post(n):
+    client = m.app.test_client()
+    data = {'client_name': 'Load test', 'phone': '+70000000000', 'category_id': '1'}
+    time.sleep(max(0, start - time.time()))
+    while time.time() < start + seconds:
+        before = time.perf_counter()
+        status = client.post('/submit_request', data=data).status_code
+        latencies.append(time.perf_counter() - before)
+        if status != 302:
+            errors.append(status)
+
+workers = [threading.Thread(target=post, args=(n,)) for n in range(threads)]
+for worker in workers:
+    worker.start()
+for worker in workers:
+    worker.join()
+print(json.dumps({'latencies': latencies, 'errors': len(errors)}))
+'''
+
+COUNT = '''
+from app import app
+from models import Request
+with app.app_context():
+    print(Request.query.count())
+'''
+
+
+def run(mode, args, directory):
+    settings = os.path.join(directory, f'{mode}.cfg')
+    with open(settings, 'w') as f:
+        f.write(SETTINGS.format(mode=mode, intake=os.path.join(directory, f'intake-{mode}'),
+                                versions=os.path.join(directory, 'versions')))
+    env = dict(os.environ, PHOTOSTUDIO_SETTINGS=settings, PYTHONPATH=ROOT,
+               DATABASE_URL='sqlite:///' + os.path.join(directory, f'{mode}.db'),
+               RATELIMIT_STORAGE_URI='memory://')
+    subprocess.run([sys.executable, '-c', 'import app; app.init_db()'], cwd=ROOT, env=env, check=True)
+
+    start = time.time() + 3  # Time for every process to import the application
+    children = [subprocess.Popen([sys.executable, '-c', CHILD, str(start), str(args.seconds), str(args.threads)],
+                                 cwd=ROOT, env=env, stdout=subprocess.PIPE, text=True)
+                for _ in range(args.processes)]
+    results = [json.loads(child.communicate()[0].splitlines()[-1]) for child in children]
+    stopped = time.time()
+
+    latencies = sorted(latency for result in results for latency in result['latencies'])
+    errors = sum(result['errors'] for result in results)
+    accepted = len(latencies) - errors
+    stored = int(subprocess.run([sys.executable, '-c', COUNT], cwd=ROOT, env=env, capture_output=True,
+                                text=True, check=True).stdout)
+    if mode == 'journal' and stored < accepted:
+        # Journals of the stopped processes are replayed by the next writer
+        subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'flush-intake'], cwd=ROOT, env=env,
+                       capture_output=True, check=True)
+        stored = int(subprocess.run([sys.executable, '-c', COUNT], cwd=ROOT, env=env, capture_output=True,
+                                    text=True, check=True).stdout)
+    drained = time.time() - stopped
+
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+    print(f'{mode:8} {accepted:9} {accepted / args.seconds:9.1f} {percentile(0.5):8.2f} {percentile(0.99):8.2f} '
+          f'{errors:7} {stored:7} {drained:10.2f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=4, help='concurrent posters per process')
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args()
+
+    print(f'{args.processes} processes x {args.threads} threads, {args.seconds:g} s per mode')
+    print(f'{"mode":8} {"accepted":>9} {"posts/s":>9} {"p50 ms":>8} {"p99 ms":>8} {"errors":>7} {"stored":>7} '
+          f'{"stored in s":>10}')
+    with tempfile.TemporaryDirectory() as directory:
+        for mode in ('direct', 'journal'):
+            run(mode, args, directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Password verifications per second, per core, and load shedding under a burst.
+
+For each pool size, a burst of concurrent logins is pushed through a
+passwords.PasswordHasher. Logins over the queue limit are refused at once
+with HasherBusy; the rest are verified. The default method is the one in
+app.config['PASSWORD_HASH_METHOD'].
+
+    python benchmarks/login_throughput.py --method pbkdf2:sha256:600000 --logins 64
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from passwords import HasherBusy, PasswordHasher  # noqa: E402
+
+PASSWORD = 'Correct-Horse-42!'
+
+
+def burst(hasher, stored_hash, logins):
+    verified, refused = [], []
+    barrier = threading.Barrier(logins)
+
+    def login():
+        barrier.wait()
+        started = time.perf_counter()
+        try:
+            assert hasher.verify(stored_hash, PASSWORD)
+        except HasherBusy:
+            refused.append(time.perf_counter() - started)
+        else:
+            verified.append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=login) for _ in range(logins)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started, verified, refused
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--method', default='pbkdf2:sha256:600000')
+    parser.add_argument('--logins', type=int, default=32, help='concurrent login attempts per burst')
+    parser.add_argument('--queue-limit', type=int, default=4)
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    stored_hash = PasswordHasher(args.method).hash(PASSWORD)
+    print(f'{args.method}, {cores} cores, bursts of {args.logins} logins, queue limit {args.queue_limit}')
+    print(f'{"workers":>7} {"verified":>9} {"refused":>8} {"logins/s":>9} {"per core":>9} '
+          f'{"verify p50 ms":>14} {"refuse max ms":>14}')
+    for workers in sorted({1, 2, cores // 2 or 1, cores}):
+        hasher = PasswordHasher(args.method, workers=workers, max_pending=args.queue_limit)
+        elapsed, verified, refused = burst(hasher, stored_hash, args.logins)
+        rate = len(verified) / elapsed
+        verified.sort()
+        print(f'{workers:7} {len(verified):9} {len(refused):8} {rate:9.1f} {rate / min(workers, cores):9.1f} '
+              f'{verified[len(verified) // 2] * 1000:14.1f} '
+              f'{(max(refused) * 1000 if refused else 0):14.2f}')
+
+    # Unbounded reference: every login hashes at once on its own thread
+    hasher = PasswordHasher(args.method, workers=args.logins, max_pending=0)
+    elapsed, verified, refused = burst(hasher, stored_hash, args.logins)
+    verified.sort()
+    print(f'{"no cap":>7} {len(verified):9} {len(refused):8} {len(verified) / elapsed:9.1f} '
+          f'{len(verified) / elapsed / cores:9.1f} {verified[len(verified) // 2] * 1000:14.1f} {0:14.2f}')
+
+
+if __name__ == '__main__':
+    main()
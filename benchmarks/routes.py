@@ -0,0 +1,230 @@
+"""Latency percentiles and query counts of every route on a seeded database.
+
+A fresh SQLite database is seeded with `flask seed` volumes (see
+seed.seed_database), then every public, API and admin route is requested
+through the Flask test client, logged in as an administrator. The page
+cache, CSRF checks and rate limits are off, so each request does its full
+work. Results can be saved as JSON and compared with an earlier run:
+
+    python benchmarks/routes.py --photos 100000 --ratings 1000000 --output before.json
+    (change something)
+    python benchmarks/routes.py --photos 100000 --ratings 1000000 --compare before.json
+
+Seeding a large dataset takes a while; --database reuses a seeded file.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SETTINGS = '''
+WTF_CSRF_ENABLED = False
+RATELIMIT_ENABLED = False
+PAGE_CACHE_BACKEND = None
+IMAGE_WORKERS = 0
+UPLOAD_SWEEP_INTERVAL = 0
+TABLE_VERSION_FOLDER = {versions!r}
+'''
+
+# (name, method, path, form data); paths are formatted with the ids from sample_ids()
+SCENARIOS = [
+    ('index', 'GET', '/', None),
+    ('services', 'GET', '/services', None),
+    ('portfolio', 'GET', '/portfolio', None),
+    ('portfolio category', 'GET', '/portfolio?category_id={category}', None),
+    ('portfolio gallery', 'GET', '/portfolio?gallery_id={gallery}', None),
+    ('portfolio tag', 'GET', '/portfolio?tag={tag}', None),
+    ('portfolio search', 'GET', '/portfolio?q={word}', None),
+    ('portfolio page 50', 'GET', '/portfolio?mode=pages&page=50', None),
+    ('about', 'GET', '/about', None),
+    ('contacts', 'GET', '/contacts', None),
+    ('contacts post', 'POST', '/contacts', {'client_name': 'Бенчмарк', 'message': 'Тестовое сообщение'}),
+    ('submit request', 'POST', '/submit_request',
+     {'client_name': 'Бенчмарк', 'phone': '+70000000000', 'category_id': '{category}'}),
+    ('csrf token', 'GET', '/csrf-token', None),
+    ('api portfolio', 'GET', '/api/v1/portfolio', None),
+    ('api portfolio 500', 'GET', '/api/v1/portfolio?limit=500&fields=id,title,tags,category_name', None),
+    ('api search', 'GET', '/api/v1/search?q={word}', None),
+    ('api rate', 'POST', '/api/v1/portfolio/{item}/rating', {'score': '5'}),
+    ('admin login', 'GET', '/admin', None),
+    ('admin register', 'GET', '/register', None),
+    ('admin dashboard', 'GET', '/admin/dashboard', None),
+    ('admin dashboard 365', 'GET', '/admin/dashboard?days=365', None),
+    ('admin categories', 'GET', '/admin/categories', None),
+    ('admin category add', 'GET', '/admin/categories/add', None),
+    ('admin category edit', 'GET', '/admin/categories/edit/{category}', None),
+    ('admin portfolio', 'GET', '/admin/portfolio', None),
+    ('admin portfolio add', 'GET', '/admin/portfolio/add', None),
+    ('admin portfolio import', 'GET', '/admin/portfolio/import', None),
+    ('admin import status', 'GET', '/admin/portfolio/import/status?ids={item}', None),
+    ('admin portfolio edit', 'GET', '/admin/portfolio/edit/{item}', None),
+    ('admin reviews', 'GET', '/admin/reviews', None),
+    ('admin review add', 'GET', '/admin/reviews/add', None),
+    ('admin review edit', 'GET', '/admin/reviews/edit/{review}', None),
+    ('admin requests', 'GET', '/admin/requests', None),
+    ('admin requests filtered', 'GET', '/admin/requests?category_id={category}&q={word}', None),
+    ('admin requests export', 'GET', '/admin/requests/export?format=csv&category_id={category}', None),
+    ('admin galleries', 'GET', '/admin/galleries', None),
+    ('admin gallery add', 'GET', '/admin/galleries/add', None),
+    ('admin gallery edit', 'GET', '/admin/galleries/edit/{gallery}', None),
+    ('admin tags', 'GET', '/admin/tags', None),
+    ('admin tag add', 'GET', '/admin/tags/add', None),
+    ('admin tag edit', 'GET', '/admin/tags/edit/{tag_id}', None),
+    ('admin comments', 'GET', '/admin/comments', None),
+    ('admin ratings', 'GET', '/admin/ratings', None),
+    ('admin diagnostics', 'GET', '/admin/diagnostics', None),
+    ('admin profiles', 'GET', '/admin/profiles', None),
+]
+
+
+def sample_ids(m):
+    """Ids of existing rows to put into the scenario paths"""
+    from sqlalchemy import func, select
+    from models import Category, Gallery, PhotoTag, PortfolioItem, Review, User
+    from seed import SEED_WORDS
+    with m.app.app_context():
+        session = m.db.session
+        # app.init_db() creates categories but no reviews or galleries
+        if session.scalar(select(func.count(Review.id))) == 0:
+            session.add(Review(client_name='Бенчмарк', text='Отзыв для бенчмарка'))
+        if session.scalar(select(func.count(Gallery.id))) == 0:
+            session.add(Gallery(name='Бенчмарк', user_id=session.scalar(select(func.min(User.id)))))
+        session.commit()
+        tag_id, tag = session.execute(select(PhotoTag.id, PhotoTag.name).order_by(PhotoTag.id)).first()
+        return {
+            'category': session.scalar(select(func.min(Category.id))),
+            'gallery': session.scalar(select(func.min(Gallery.id))),
+            'item': session.scalar(select(func.max(PortfolioItem.id))),
+            'review': session.scalar(select(func.min(Review.id))),
+            'tag': tag,
+            'tag_id': tag_id,
+            'word': SEED_WORDS[0],
+        }
+
+
+def run_scenarios(m, ids, runs):
+    from sqlalchemy import event
+    statements = []
+    with m.app.app_context():
+        event.listen(m.db.engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+    client = m.app.test_client()
+    with client.session_transaction() as session:
+        session['admin_logged_in'] = True
+
+    results = {}
+    for name, method, path, data in SCENARIOS:
+        path = path.format(**ids)
+        data = {key: value.format(**ids) for key, value in data.items()} if data else None
+        timings, queries = [], []
+        for run in range(runs + 1):
+            statements.clear()
+            started = time.perf_counter()
+            response = client.open(path, method=method, data=data)
+            response.get_data()  # Streamed responses are generated here
+            elapsed = time.perf_counter() - started
+            if response.status_code >= 400:
+                raise SystemExit(f'{name}: {method} {path} returned {response.status_code}')
+            if run:  # The first request warms up caches and is not counted
+                timings.append(elapsed)
+                queries.append(len(statements))
+        timings.sort()
+
+        def percentile(p):
+            return timings[min(len(timings) - 1, int(len(timings) * p))] * 1000
+
+        results[name] = {'p50': percentile(0.5), 'p90': percentile(0.9), 'p99': percentile(0.99),
+                         'max': timings[-1] * 1000, 'queries': max(queries)}
+    return results
+
+
+def uncovered_endpoints(m):
+    covered = {m.app.url_map.bind('localhost').match(path.split('?')[0].format(
+        **{key: 1 for key in ('category', 'gallery', 'item', 'review', 'tag_id')}), method=method)[0]
+        for _, method, path, _ in SCENARIOS}
+    return sorted(rule.endpoint for rule in m.app.url_map.iter_rules()
+                  if rule.endpoint not in covered and rule.endpoint != 'static'
+                  and 'GET' in rule.methods and '/delete/' not in rule.rule and rule.endpoint != 'admin.admin_logout')
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--photos', type=int, default=10000)
+    parser.add_argument('--tags-per-photo', type=int, default=2)
+    parser.add_argument('--comments', type=int, default=20000)
+    parser.add_argument('--ratings', type=int, default=100000)
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--runs', type=int, default=20, help='measured requests per route')
+    parser.add_argument('--database', help='SQLite file to use; seeded only if it does not exist yet')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON file of an earlier run to compare with')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='photostudio-bench-')
+    database = os.path.abspath(args.database) if args.database else os.path.join(directory, 'bench.db')
+    fresh = not os.path.exists(database)
+    settings = os.path.join(directory, 'settings.cfg')
+    with open(settings, 'w') as f:
+        f.write(SETTINGS.format(versions=os.path.join(directory, 'versions')))
+    os.environ.update(PHOTOSTUDIO_SETTINGS=settings, DATABASE_URL='sqlite:///' + database,
+                      RATELIMIT_STORAGE_URI='memory://')
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+    import app as m
+    from models import SiteCounter
+    from seed import seed_database
+
+    m.create_app()
+    m.init_db()
+    dataset = {key: getattr(args, key) for key in ('photos', 'tags_per_photo', 'comments', 'ratings', 'requests')}
+    if fresh:
+        started = time.perf_counter()
+        with m.app.app_context():
+            seed_database(**dataset)
+        print(f'Seeded {database} in {time.perf_counter() - started:.1f} s')
+    with m.app.app_context():
+        from sqlalchemy import select
+        counts = dict(m.db.session.execute(select(SiteCounter.name, SiteCounter.value)).all())
+    print(', '.join(f'{count} {table}' for table, count in sorted(counts.items())) + f'; {args.runs} runs per route')
+    for endpoint in uncovered_endpoints(m):
+        print(f'Not benchmarked: {endpoint}')
+
+    results = run_scenarios(m, sample_ids(m), args.runs)
+
+    previous = {}
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)['results']
+    print(f'{"route":26} {"p50 ms":>8} {"p90 ms":>8} {"p99 ms":>8} {"max ms":>8} {"queries":>8}'
+          + (f' {"p50 vs before":>14} {"queries before":>15}' if previous else ''))
+    for name, result in results.items():
+        line = (f'{name:26} {result["p50"]:8.2f} {result["p90"]:8.2f} {result["p99"]:8.2f} {result["max"]:8.2f} '
+                f'{result["queries"]:8}')
+        if name in previous:
+            change = (result['p50'] / previous[name]['p50'] - 1) * 100 if previous[name]['p50'] else 0
+            line += f' {change:+13.1f}% {previous[name]["queries"]:15}'
+        print(line)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'revision': git_revision(), 'created': datetime.utcnow().isoformat(timespec='seconds'),
+                       'database': database if args.database else None, 'rows': counts,
+                       'runs': args.runs, 'results': results}, f, indent=2, ensure_ascii=False)
+        print(f'Results written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
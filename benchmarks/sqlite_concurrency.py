@@ -0,0 +1,131 @@
+"""Read/write concurrency of the SQLite database, before and after the engine profile.
+
+Reader threads run the portfolio listing query while writer threads insert
+requests, each in its own transaction, against a fresh database file. The
+"default" run uses a plain create_engine() with pysqlite's defaults
+(rollback journal, 5 s busy handler); the "profile" run uses the engine
+options and pragmas of dbprofile.
+
+    python benchmarks/sqlite_concurrency.py --readers 8 --writers 4 --seconds 10
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import (Column, DateTime, ForeignKey, Integer, MetaData, String, Table, Text, create_engine,
+                        insert, select)
+from sqlalchemy.exc import OperationalError
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dbprofile import configure_engine, engine_options  # noqa: E402
+
+metadata = MetaData()
+category = Table('category', metadata,
+                 Column('id', Integer, primary_key=True),
+                 Column('name', String(100), nullable=False))
+portfolio_item = Table('portfolio_item', metadata,
+                       Column('id', Integer, primary_key=True),
+                       Column('title', String(200)),
+                       Column('description', Text),
+                       Column('image_filename', String(200), nullable=False),
+                       Column('category_id', Integer, ForeignKey('category.id'), nullable=False),
+                       Column('created_at', DateTime, index=True))
+request_table = Table('request', metadata,
+                      Column('id', Integer, primary_key=True),
+                      Column('client_name', String(100), nullable=False),
+                      Column('phone', String(20), nullable=False),
+                      Column('category_id', Integer, ForeignKey('category.id')),
+                      Column('message', Text),
+                      Column('created_at', DateTime))
+
+LISTING = (select(portfolio_item.c.id, portfolio_item.c.title, portfolio_item.c.image_filename, category.c.name)
+           .join(category, portfolio_item.c.category_id == category.c.id)
+           .order_by(portfolio_item.c.created_at.desc(), portfolio_item.c.id.desc())
+           .limit(12))
+
+
+def seed(engine, items):
+    metadata.create_all(engine)
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        conn.execute(insert(category), [{'id': i, 'name': f'Категория {i}'} for i in range(1, 6)])
+        conn.execute(insert(portfolio_item), [
+            {'title': f'Фото {i}', 'description': 'x' * 200, 'image_filename': f'{i:064x}.jpg',
+             'category_id': i % 5 + 1, 'created_at': now} for i in range(items)])
+
+
+def worker(engine, operation, deadline, results):
+    latencies, errors = [], 0
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            operation(engine)
+        except OperationalError:
+            errors += 1  # "database is locked"
+            continue
+        latencies.append(time.perf_counter() - started)
+    results.append((latencies, errors))
+
+
+def read(engine):
+    with engine.connect() as conn:
+        conn.execute(LISTING).all()
+
+
+def write(engine):
+    with engine.begin() as conn:
+        conn.execute(insert(request_table).values(client_name='Клиент', phone='+70000000000', category_id=1,
+                                                  message='Хочу фотосессию', created_at=datetime.utcnow()))
+
+
+def run(name, engine, readers, writers, seconds):
+    deadline = time.perf_counter() + seconds
+    read_results, write_results = [], []
+    threads = ([threading.Thread(target=worker, args=(engine, read, deadline, read_results))
+                for _ in range(readers)]
+               + [threading.Thread(target=worker, args=(engine, write, deadline, write_results))
+                  for _ in range(writers)])
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for label, results in (('reads', read_results), ('writes', write_results)):
+        latencies = sorted(latency for thread_latencies, _ in results for latency in thread_latencies)
+        errors = sum(thread_errors for _, thread_errors in results)
+        if latencies:
+            p95 = latencies[int(len(latencies) * 0.95) - 1] if len(latencies) > 1 else latencies[0]
+            print(f'{name:8} {label:7} {len(latencies) / seconds:9.0f}/s  p50 {statistics.median(latencies) * 1000:7.2f} ms'
+                  f'  p95 {p95 * 1000:7.2f} ms  max {latencies[-1] * 1000:8.2f} ms  locked {errors}')
+        else:
+            print(f'{name:8} {label:7} no successful operations, locked {errors}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--items', type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        for name in ('default', 'profile'):
+            url = 'sqlite:///' + os.path.join(directory, name + '.db')
+            if name == 'default':
+                engine = create_engine(url)
+            else:
+                engine = create_engine(url, **engine_options(url, pool_size=args.readers + args.writers))
+                configure_engine(engine)
+            seed(engine, args.items)
+            run(name, engine, args.readers, args.writers, args.seconds)
+            engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
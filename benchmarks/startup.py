@@ -0,0 +1,77 @@
+"""Cold-start cost of each entry point.
+
+Every sample runs in a fresh interpreter and measures how long importing
+the entry module takes and, for the WSGI entry point, how long the first
+request to a page takes afterwards. "app" is what CLI commands load
+(each then imports what it needs), "init_db" adds the models, and
+"wsgi" is what the production server loads.
+
+    python benchmarks/startup.py --runs 7
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (entry module, path of the first request or None)
+SCENARIOS = [
+    ('app', None),
+    ('init_db', None),
+    ('wsgi', None),
+    ('wsgi', '/'),
+    ('wsgi', '/portfolio'),
+    ('wsgi', '/admin'),
+    ('wsgi', '/api/v1/portfolio'),
+]
+
+CHILD = '''
+import json, sys, time
+started = time.perf_counter()
+module = __import__(sys.argv[1])
+imported = time.perf_counter()
+first_request = None
+if sys.argv[2]:
+    client = module.app.test_client()
+    before = time.perf_counter()
+    status = client.get(sys.argv[2]).status_code
+    assert status == 200, status
+    first_request = time.perf_counter() - before
+print(json.dumps({'import': imported - started, 'first_request': first_request,
+                  'modules': len(sys.modules)}))
+'''
+
+
+def sample(module, path, env):
+    output = subprocess.run([sys.executable, '-c', CHILD, module, path or ''], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(os.environ,
+                   DATABASE_URL='sqlite:///' + os.path.join(directory, 'startup.db'),
+                   RATELIMIT_STORAGE_URI='memory://',
+                   PYTHONPATH=ROOT)
+        subprocess.run([sys.executable, '-c', 'import app; app.init_db()'], cwd=ROOT, env=env, check=True)
+
+        print(f'{"entry":7} {"first request":20} {"import ms":>10} {"request ms":>11} {"modules":>8}')
+        for module, path in SCENARIOS:
+            samples = [sample(module, path, env) for _ in range(args.runs)]
+            import_ms = statistics.median(s['import'] for s in samples) * 1000
+            request_ms = (statistics.median(s['first_request'] for s in samples) * 1000) if path else None
+            print(f'{module:7} {path or "-":20} {import_ms:10.1f} '
+                  f'{"-" if request_ms is None else f"{request_ms:.1f}":>11} {samples[0]["modules"]:8}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""Expand a bulk upload of images and ZIP archives into individual images.
+
+Uploaded files are read as streams, and archives are opened in place:
+Werkzeug spools large uploads to temporary files. Every archive member is
+decompressed while it is copied out, so no photo is ever held in memory
+whole.
+"""
+import os
+import zipfile
+
+from storage import upload_extension
+
+IMAGE_EXTENSIONS = {'.jpg', '.png', '.webp', '.gif', '.tif', '.tiff', '.bmp', '.avif'}
+
+# Limits on archive members, checked against the sizes declared in the archive
+MAX_ARCHIVE_ENTRIES = 5000
+MAX_ENTRY_SIZE = 200 * 1024 * 1024
+
+ZIP_UTF8_FLAG = 0x800
+
+
+def _member_name(info):
+    """Base name of an archive member, fixing names stored in a DOS code page"""
+    name = info.filename
+    if not info.flag_bits & ZIP_UTF8_FLAG:
+        # Without the UTF-8 flag zipfile decodes as cp437; Russian Windows archivers write cp866
+        try:
+            name = name.encode('cp437').decode('cp866')
+        except UnicodeError:
+            pass
+    return os.path.basename(name.rstrip('/'))
+
+
+def _archive_images(file_storage, skipped):
+    try:
+        archive = zipfile.ZipFile(file_storage.stream)
+    except zipfile.BadZipFile:
+        skipped.append((file_storage.filename, 'повреждённый архив'))
+        return
+    with archive:
+        members = [info for info in archive.infolist() if not info.is_dir()]
+        if len(members) > MAX_ARCHIVE_ENTRIES:
+            skipped.append((file_storage.filename, f'больше {MAX_ARCHIVE_ENTRIES} файлов в архиве'))
+            return
+        for info in members:
+            name = _member_name(info)
+            if info.filename.startswith('__MACOSX/') or name.startswith('.'):
+                continue
+            if upload_extension(name) not in IMAGE_EXTENSIONS:
+                skipped.append((name, 'не изображение'))
+            elif info.file_size > MAX_ENTRY_SIZE:
+                skipped.append((name, 'слишком большой файл'))
+            else:
+                with archive.open(info) as stream:
+                    yield name, stream
+
+
+def expand_uploads(file_storages, skipped):
+    """Yield (filename, stream) for every image among the uploads, opening ZIP archives.
+
+    Entries that are not imported are appended to skipped as (filename, reason).
+    Each stream is only valid until the next item is requested.
+    """
+    for file_storage in file_storages:
+        if not file_storage or not file_storage.filename:
+            continue
+        extension = os.path.splitext(file_storage.filename)[1].lower()
+        if extension == '.zip':
+            yield from _archive_images(file_storage, skipped)
+        elif upload_extension(file_storage.filename) in IMAGE_EXTENSIONS:
+            yield file_storage.filename, file_storage.stream
+        else:
+            skipped.append((file_storage.filename, 'не изображение'))
@@ -0,0 +1,48 @@
+"""Client requests submitted through the site's forms.
+
+In the default 'direct' intake mode each request is committed while the
+visitor waits. In 'journal' mode it is appended to a local journal and
+the batch writer inserts journaled requests in bulk (see intake.py).
+"""
+import os
+import uuid
+from datetime import datetime
+
+from sqlalchemy import select
+
+from app import app, db
+from intake import Journal, BatchWriter
+from models import Category, Request, dialect_insert, record_stats
+
+def accept_request(client_name, phone, category_id=None, message=None):
+    """Store a submitted request, or journal it for the batch writer in write-behind mode"""
+    if app.config['REQUEST_INTAKE'] != 'journal':
+        db.session.add(Request(client_name=client_name, phone=phone, category_id=category_id, message=message))
+        db.session.commit()
+        return
+    request_journal.append({'intake_id': uuid.uuid4().hex, 'client_name': client_name, 'phone': phone,
+                            'category_id': category_id, 'message': message,
+                            'created_at': datetime.utcnow().isoformat()})
+    request_writer.wake()
+
+def write_request_batch(records):
+    """Insert journaled requests in one transaction, skipping any that were already written"""
+    with app.app_context():
+        # Categories deleted since the request was accepted are dropped, like deleting them does
+        category_ids = {record['category_id'] for record in records if record['category_id']}
+        existing = set(db.session.scalars(select(Category.id).where(Category.id.in_(category_ids))))
+        rows = [dict(record, created_at=datetime.fromisoformat(record['created_at']),
+                     category_id=record['category_id'] if record['category_id'] in existing else None)
+                for record in records]
+        stmt = dialect_insert(Request).values(rows).on_conflict_do_nothing(index_elements=['intake_id'])
+        created = db.session.scalars(stmt.returning(Request.created_at)).all()
+        request_days = {}
+        for created_at in created:
+            request_days[created_at.date()] = request_days.get(created_at.date(), 0) + 1
+        record_stats(db.session, {'request': len(created)}, request_days)
+        db.session.commit()
+
+request_journal = Journal(app.config['INTAKE_FOLDER'], fsync=app.config['INTAKE_FSYNC'])
+request_writer = BatchWriter(request_journal, write_request_batch,
+                             os.path.join(app.config['INTAKE_FOLDER'], 'write.lock'),
+                             interval=app.config['INTAKE_FLUSH_INTERVAL'], batch_size=app.config['INTAKE_BATCH_SIZE'])
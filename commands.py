@@ -0,0 +1,99 @@
+"""CLI commands, registered on the application when app.py is imported.
+
+Each command imports what it needs when it runs, so `flask --help` and
+every other command load neither the web layer nor unrelated services.
+"""
+import time
+
+import click
+
+from app import app, db
+
+@app.cli.command('sweep-uploads')
+@click.option('--orphans', is_flag=True, help='Also scan the upload folder for unreferenced files.')
+def sweep_uploads_command(orphans):
+    """Delete released upload files now."""
+    from uploads import upload_sweeper
+    if not upload_sweeper.run_once(orphans=orphans or None):
+        print('Another process is sweeping.')
+        return
+    print('Uploads swept.')
+
+@app.cli.command('build-assets')
+def build_assets_command():
+    """Fingerprint and precompress the static CSS and JS."""
+    from assets import build as build_assets
+    try:
+        manifest = build_assets(app.static_folder)
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+    for source, built in manifest.items():
+        print(f'{source} -> {built}')
+
+@app.cli.command('process-images')
+def process_images_command():
+    """Process all queued image jobs in the foreground."""
+    from uploads import image_jobs
+    count = image_jobs.run_pending()
+    print(f'Processed {count} image job(s).')
+
+@app.cli.command('reindex-search')
+def reindex_search_command():
+    """Rebuild the portfolio full-text search index."""
+    from models import search_index, rebuild_search_index
+    search_index.ensure(db.session)
+    rebuild_search_index()
+    db.session.commit()
+    print('Search index rebuilt.')
+
+@app.cli.command('recount-ratings')
+def recount_ratings_command():
+    """Rebuild the denormalised rating aggregates of portfolio items."""
+    from models import recount_ratings
+    recount_ratings()
+    db.session.commit()
+    print('Rating aggregates recomputed.')
+
+@app.cli.command('recount-stats')
+def recount_stats_command():
+    """Rebuild the dashboard counters from the tables they count."""
+    from models import recount_stats
+    recount_stats()
+    db.session.commit()
+    print('Dashboard statistics recomputed.')
+
+@app.cli.command('flush-intake')
+def flush_intake_command():
+    """Write journaled requests to the database now, including those left by stopped processes."""
+    from client_requests import request_writer
+    written = request_writer.flush()
+    if written is None:
+        print('Another process is writing.')
+        return
+    print(f'{written} journaled requests written.')
+
+@app.cli.command('clear-page-cache')
+def clear_page_cache_command():
+    """Drop every cached public page."""
+    from web import page_cache
+    page_cache.clear()
+    print('Page cache cleared.')
+
+@app.cli.command('seed')
+@click.option('--photos', default=1000, show_default=True, help='Portfolio items to add.')
+@click.option('--tags-per-photo', default=2, show_default=True)
+@click.option('--comments', default=5000, show_default=True)
+@click.option('--ratings', default=10000, show_default=True)
+@click.option('--requests', default=2000, show_default=True)
+@click.option('--days', default=365, show_default=True, help='Spread creation dates over this many days.')
+@click.option('--seed', default=0, show_default=True, help='Random seed; the same seed adds the same rows.')
+def seed_command(photos, tags_per_photo, comments, ratings, requests, days, seed):
+    """Add synthetic data with bulk inserts, e.g. --photos 100000 --ratings 1000000."""
+    from seed import seed_database
+    started = time.perf_counter()
+    try:
+        added = seed_database(photos, tags_per_photo, comments, ratings, requests, days, seed)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    print(', '.join(f'{count} {table}' for table, count in added.items()),
+          f'added in {time.perf_counter() - started:.1f} s.')
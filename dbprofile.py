@@ -0,0 +1,71 @@
+"""Engine settings for the application database.
+
+The database URL comes from the environment, so the same code runs on the
+bundled SQLite file or on a server database. SQLite connections are set up
+for concurrent use: in WAL mode readers never block the writer and the
+writer never blocks readers, and writers queue for busy_timeout instead of
+failing with "database is locked" at once.
+"""
+import os
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+# Applied to every new SQLite connection, in this order
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',  # Durable across application crashes; WAL keeps the file consistent on power loss
+    'busy_timeout': 5000,  # Milliseconds a writer waits for the lock
+    'foreign_keys': 'ON',  # SQLite ignores ON DELETE clauses without it
+    'cache_size': -32000,  # Negative values are KiB: 32 MB of page cache per connection
+    'mmap_size': 256 * 1024 * 1024,  # Reads go through the OS page cache instead of read() copies
+    'temp_store': 'MEMORY',
+}
+
+
+def database_url(default):
+    """DATABASE_URL from the environment, or default"""
+    url = os.environ.get('DATABASE_URL', default)
+    # Hosting providers still hand out the scheme SQLAlchemy dropped in 1.4
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def is_sqlite_file(url):
+    url = make_url(url)
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+
+
+def engine_options(url, pool_size=5, max_overflow=10, pool_timeout=30, pool_recycle=1800):
+    """SQLALCHEMY_ENGINE_OPTIONS for url"""
+    url = make_url(url)
+    if url.get_backend_name() == 'sqlite':
+        if not is_sqlite_file(url):
+            return {}  # In-memory databases live in a single static connection
+        # Connections are cheap, but keeping them open keeps their page cache and mmap warm
+        return {'pool_size': pool_size, 'max_overflow': max_overflow, 'pool_timeout': pool_timeout,
+                'connect_args': {'check_same_thread': False}}
+    # Server databases drop idle connections; check them out and recycle before that happens
+    return {'pool_size': pool_size, 'max_overflow': max_overflow, 'pool_timeout': pool_timeout,
+            'pool_recycle': pool_recycle, 'pool_pre_ping': True}
+
+
+def apply_sqlite_pragmas(dbapi_connection, pragmas):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+    finally:
+        cursor.close()
+
+
+def configure_engine(engine, pragmas=None):
+    """Run the SQLite pragmas on every connection engine opens; other backends are left alone"""
+    if engine.dialect.name != 'sqlite':
+        return
+    pragmas = SQLITE_PRAGMAS if pragmas is None else pragmas
+
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        apply_sqlite_pragmas(dbapi_connection, pragmas)
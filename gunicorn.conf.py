@@ -0,0 +1,65 @@
+"""Gunicorn settings for production.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+The application is imported once in the master (preload_app) and the
+database is created, upgraded and seeded and the static assets are built
+there before any worker starts. Workers are forked from the loaded master,
+so they start at once and share its memory pages copy-on-write. Each
+worker is replaced after max_requests requests, staggered by the jitter.
+
+kill -HUP <master> replaces the workers gracefully, but with preloading
+they keep the code the master loaded. To deploy new code, send USR2 to
+start a new master next to the old one, then WINCH and QUIT to the old one.
+"""
+import gc
+import multiprocessing
+import os
+
+# Production runs behind one load balancer; read by app.py, which is imported after this file
+os.environ.setdefault('TRUSTED_PROXIES', '1')
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 1))
+preload_app = True
+
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = max_requests // 10
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = '-'
+errorlog = '-'
+
+
+def on_starting(server):
+    from app import app, init_db
+    from assets import build as build_assets
+    init_db()
+    # Workers link the files of this build; earlier builds stay for pages rendered before the deploy
+    build_assets(app.static_folder)
+
+
+def when_ready(server):
+    # Objects loaded so far live for the whole run; keep the collector from touching
+    # (and so copying) their pages in every worker
+    gc.collect()
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    from app import reset_after_fork
+    reset_after_fork()
+
+
+def worker_exit(server, worker):
+    # Hand requests journaled by this worker to the database (or to the next writer) before it goes
+    from app import app
+    from client_requests import request_writer
+    from web import metrics
+    if app.config['REQUEST_INTAKE'] == 'journal':
+        request_writer.flush()
+    # Last counts of this worker, archived by the next scrape
+    metrics.flush()
@@ -0,0 +1,187 @@
+"""Responsive image derivatives for uploaded photos."""
+import os
+
+from PIL import Image, ImageOps, features
+
+# Derivative widths in pixels, smallest first
+DERIVATIVE_SIZES = (
+    ('thumb', 480),
+    ('medium', 1024),
+    ('full', 1920),
+)
+
+# Encoder settings for each output format, best compression first
+FORMAT_OPTIONS = {
+    'avif': {'quality': 55, 'speed': 6},
+    'webp': {'quality': 80, 'method': 4},
+    'jpeg': {'quality': 82, 'optimize': True, 'progressive': True},
+}
+
+FORMAT_EXTENSIONS = {'avif': 'avif', 'webp': 'webp', 'jpeg': 'jpg'}
+
+ORIENTATION_TAG = 0x0112
+EXIF_IFD_TAG = 0x8769
+
+# EXIF fields kept in image_meta, by tag id
+EXIF_FIELDS = {
+    0x010F: 'camera_make',
+    0x0110: 'camera_model',
+    0xA434: 'lens',
+    0x9003: 'taken_at',
+    0x829A: 'exposure_time',
+    0x829D: 'f_number',
+    0x8827: 'iso',
+    0x920A: 'focal_length',
+}
+
+# Originals are capped to this long side and re-encoded when that saves space
+ORIGINAL_MAX_SIDE = 4096
+ORIGINAL_JPEG_QUALITY = 90
+
+
+def available_formats():
+    """Return the output formats supported by the installed Pillow build"""
+    formats = []
+    for fmt in FORMAT_OPTIONS:
+        if fmt == 'jpeg' or features.check(fmt):
+            formats.append(fmt)
+    return formats
+
+
+def _target_widths(width):
+    """Pick derivative widths that do not upscale the original"""
+    targets = [(name, w) for name, w in DERIVATIVE_SIZES if w < width]
+    if len(targets) < len(DERIVATIVE_SIZES):
+        # The original is narrower than the next size: use it as is for that slot
+        name = DERIVATIVE_SIZES[len(targets)][0]
+        targets.append((name, width))
+    return targets
+
+
+def _flatten(img):
+    """Composite transparent images onto white for formats without alpha"""
+    if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
+        rgba = img.convert('RGBA')
+        background = Image.new('RGB', rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.split()[-1])
+        return background
+    return img.convert('RGB')
+
+
+def generate_derivatives(source_path, output_dir, stem):
+    """Write resized copies of source_path in every available format.
+
+    Returns a JSON-serialisable description of the files written, suitable
+    for storing in ``image_variants``.
+    """
+    largest = DERIVATIVE_SIZES[-1][1]
+    formats = available_formats()
+
+    with Image.open(source_path) as img:
+        original_width, original_height = img.size
+        if img.getexif().get(ORIENTATION_TAG) in (5, 6, 7, 8):
+            original_width, original_height = original_height, original_width
+
+        # Let the JPEG decoder downscale while decoding: much faster for camera originals
+        img.draft('RGB', (largest, largest))
+        img = ImageOps.exif_transpose(img)
+        has_alpha = img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info)
+        img = img.convert('RGBA' if has_alpha else 'RGB')
+
+        sizes = []
+        current = img
+        # Resize from the largest size down so every step starts from a smaller image
+        for name, width in reversed(_target_widths(min(original_width, img.width))):
+            height = max(1, round(current.height * width / current.width))
+            if (width, height) != current.size:
+                current = current.resize((width, height), Image.LANCZOS)
+
+            files = {}
+            for fmt in formats:
+                filename = f'{stem}_{width}w.{FORMAT_EXTENSIONS[fmt]}'
+                frame = _flatten(current) if fmt == 'jpeg' else current
+                frame.save(os.path.join(output_dir, filename), format=fmt.upper(), **FORMAT_OPTIONS[fmt])
+                files[fmt] = filename
+
+            sizes.append({'name': name, 'width': width, 'height': height, 'files': files})
+
+    sizes.reverse()
+    return {'width': original_width, 'height': original_height, 'sizes': sizes}
+
+
+def extract_metadata(source_path):
+    """Read format, dimensions and the interesting EXIF fields of an image"""
+    with Image.open(source_path) as img:
+        meta = {'format': img.format, 'width': img.width, 'height': img.height}
+        exif = img.getexif()
+        tags = dict(exif)
+        tags.update(exif.get_ifd(EXIF_IFD_TAG))
+
+    for tag, name in EXIF_FIELDS.items():
+        value = tags.get(tag)
+        if value is None:
+            continue
+        if isinstance(value, bytes):
+            value = value.decode('utf-8', 'replace')
+        if isinstance(value, str):
+            value = value.strip('\x00 ')
+        elif isinstance(value, tuple):
+            value = value[0] if value else None
+        else:
+            # IFDRational and friends
+            value = float(value) if not isinstance(value, int) else value
+        if value not in (None, ''):
+            meta[name] = value
+    return meta
+
+
+def recompress_original(source_path, dest_path):
+    """Write a smaller copy of an oversized or poorly compressed original.
+
+    JPEGs larger than ORIGINAL_MAX_SIDE are downscaled and re-encoded, PNGs
+    are re-saved with optimisation; EXIF and ICC data are preserved. The
+    original is left untouched. Returns True if dest_path was written,
+    which only happens when the result is smaller.
+    """
+    with Image.open(source_path) as img:
+        options = {}
+        if img.info.get('icc_profile'):
+            options['icc_profile'] = img.info['icc_profile']
+
+        if img.format == 'JPEG' and max(img.size) > ORIGINAL_MAX_SIDE:
+            if img.info.get('exif'):
+                options['exif'] = img.info['exif']
+            img.draft('RGB', (ORIGINAL_MAX_SIDE, ORIGINAL_MAX_SIDE))
+            resized = img.copy()
+            resized.thumbnail((ORIGINAL_MAX_SIDE, ORIGINAL_MAX_SIDE), Image.LANCZOS)
+            resized.save(dest_path, format='JPEG', quality=ORIGINAL_JPEG_QUALITY,
+                         optimize=True, progressive=True, **options)
+        elif img.format == 'PNG':
+            img.save(dest_path, format='PNG', optimize=True, **options)
+        else:
+            return False
+
+    if os.path.getsize(dest_path) >= os.path.getsize(source_path):
+        os.remove(dest_path)
+        return False
+    return True
+
+
+def process_image(source_path, output_dir, stem, scratch_path):
+    """Background pipeline for one upload: metadata, recompression, derivatives.
+
+    A recompressed original is left at scratch_path for the caller to store;
+    ``recompressed`` in the result is scratch_path or None.
+    """
+    meta = extract_metadata(source_path)
+    os.makedirs(os.path.dirname(scratch_path), exist_ok=True)
+    recompressed = recompress_original(source_path, scratch_path)
+    variants = generate_derivatives(scratch_path if recompressed else source_path, output_dir, stem)
+    return {'meta': meta, 'variants': variants, 'recompressed': scratch_path if recompressed else None}
+
+
+def derivative_files(variants):
+    """List every file name recorded in a variants description"""
+    if not variants:
+        return []
+    return [filename for size in variants['sizes'] for filename in size['files'].values()]
@@ -1,10 +1,14 @@
-from app import app, db, User, Category, PortfolioItem, Review, Gallery, PhotoTag
+from app import app, db
+from models import upgrade_schema, search_index, rebuild_search_index, User, Category, PortfolioItem, Review, Gallery, PhotoTag
 
 
 def init_database():
     with app.app_context():
         # Create all tables
         db.create_all()
+        upgrade_schema()
+        if search_index.ensure(db.session):
+            rebuild_search_index()
         
         # Check if admin user already exists
         admin_user = User.query.filter_by(username='admin').first()
@@ -0,0 +1,178 @@
+"""Write-behind intake: accept records into a local journal, write them to the database in batches.
+
+Each process appends to its own segment file (JSON lines, fsynced by
+default) and holds an exclusive lock on it while it is open. A background
+writer seals the process's segment every interval and passes the records
+of every sealed segment to a write callable in batches; a lock file makes
+sure only one process writes at a time. A segment whose owner died still
+being open is unlocked, so it is picked up by the next writer: nothing
+accepted is lost across crashes or restarts. Records may be written twice
+if a process dies between writing a batch and deleting its segment, so
+write() should skip records it has already stored.
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single process is assumed
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+def _try_lock(fd):
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except BlockingIOError:
+        return False
+
+
+class Journal:
+    """Directory of segment files: '<pid>-<n>.open' while written, '.ready' once sealed"""
+
+    def __init__(self, directory, fsync=True):
+        self.directory = directory
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._fd = None
+        self._path = None
+        self._pid = None
+        self._sequence = 0
+
+    def append(self, record):
+        line = (json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
+        with self._lock:
+            if self._pid != os.getpid():
+                # A forked process must not write to (or seal) its parent's segment
+                if self._fd is not None:
+                    os.close(self._fd)
+                self._fd = None
+                self._pid = os.getpid()
+            if self._fd is None:
+                self._open()
+            os.write(self._fd, line)
+            if self.fsync:
+                os.fsync(self._fd)
+
+    def _open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._sequence += 1
+        self._path = os.path.join(self.directory, f'{os.getpid()}-{self._sequence}.open')
+        self._fd = os.open(self._path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        _try_lock(self._fd)
+
+    def seal(self):
+        """Close this process's segment, if it has one, and mark it ready"""
+        with self._lock:
+            if self._fd is None or self._pid != os.getpid():
+                return
+            # Renamed while still locked, so no writer can mistake it for an orphan
+            os.replace(self._path, self._path[:-len('.open')] + '.ready')
+            os.close(self._fd)
+            self._fd = None
+
+    def ready_segments(self):
+        """Sealed segments plus segments left open by processes that are gone, oldest first"""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        own = self._path if self._fd is not None and self._pid == os.getpid() else None
+        for name in names:
+            path = os.path.join(self.directory, name)
+            if not name.endswith('.open') or path == own:
+                continue
+            try:
+                fd = os.open(path, os.O_RDONLY)
+            except FileNotFoundError:
+                continue  # Sealed meanwhile
+            try:
+                if _try_lock(fd):
+                    logger.warning('Replaying intake segment %s left by a stopped process', name)
+                    os.replace(path, path[:-len('.open')] + '.ready')
+            finally:
+                os.close(fd)
+        ready = [os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith('.ready')]
+        return sorted(ready, key=os.path.getmtime)
+
+    def read(self, path):
+        records = []
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    # The last line of a segment whose process died mid-write
+                    logger.warning('Skipping a truncated record in %s', path)
+        return records
+
+    def pending(self):
+        """Number of segment files not written to the database yet"""
+        try:
+            return sum(1 for name in os.listdir(self.directory) if name.endswith(('.open', '.ready')))
+        except FileNotFoundError:
+            return 0
+
+
+class BatchWriter:
+    """Seal and write journal segments from a background thread every interval seconds.
+
+    With interval <= 0 there is no thread and every wake() writes inline.
+    """
+
+    def __init__(self, journal, write, lock_path, interval=1.0, batch_size=500):
+        self.journal = journal
+        self.write = write
+        self.lock_path = lock_path
+        self.interval = interval
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pid = None
+
+    def start(self):
+        if self.interval <= 0 or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._loop, name='intake-writer', daemon=True).start()
+
+    def wake(self):
+        if self.interval <= 0:
+            self.flush()
+            return
+        self.start()
+
+    def flush(self):
+        """Write every ready segment unless another process is writing; returns the records written or None"""
+        self.journal.seal()
+        os.makedirs(os.path.dirname(self.lock_path), exist_ok=True)
+        with open(self.lock_path, 'a') as lock_file:
+            if not _try_lock(lock_file.fileno()):
+                return None
+            with self._flush_lock:
+                written = 0
+                for path in self.journal.ready_segments():
+                    records = self.journal.read(path)
+                    for start in range(0, len(records), self.batch_size):
+                        self.write(records[start:start + self.batch_size])
+                    os.remove(path)
+                    written += len(records)
+                return written
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Intake batch write failed; the journal is kept for the next attempt')
@@ -0,0 +1,121 @@
+"""Background job runner backed by a local process pool.
+
+The runner knows nothing about the database: the application supplies
+callables that claim persisted jobs, and that record their results once
+a worker process finishes them.
+"""
+import importlib
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+logger = logging.getLogger(__name__)
+
+
+def run_task(task, *args):
+    """Call task, a function or the 'module:function' name of one, with args"""
+    if isinstance(task, str):
+        module, name = task.split(':')
+        task = getattr(importlib.import_module(module), name)
+    return task(*args)
+
+
+class JobRunner:
+    """Dispatch claimed jobs to a process pool from a single background thread.
+
+    ``claim(limit)`` returns up to ``limit`` ``(job_id, args)`` pairs,
+    ``task(*args)`` runs in a worker process, and ``complete(job_id, result)``
+    / ``fail(job_id, error)`` are called back in the dispatching process.
+    ``task`` may be given as 'module:function', so the module is only
+    imported by the processes that run jobs.
+    """
+
+    def __init__(self, claim, task, complete, fail, workers=2, poll_interval=5.0):
+        self.claim = claim
+        self.task = task
+        self.complete = complete
+        self.fail = fail
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._pid = None
+        self._thread = None
+
+    def start(self):
+        """Start the dispatcher in this process if it is not already running"""
+        if self.workers <= 0 or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # A forked worker inherits the parent's flags but not its threads
+            self._pid = os.getpid()
+            self._wakeup = threading.Event()
+            self._thread = threading.Thread(target=self._dispatch, name='job-runner', daemon=True)
+            self._thread.start()
+
+    def wake(self):
+        """Tell the dispatcher that new jobs were committed"""
+        if self.workers <= 0:
+            self.run_pending()
+            return
+        self.start()
+        self._wakeup.set()
+
+    def run_pending(self):
+        """Process every queued job synchronously in the current process"""
+        count = 0
+        while True:
+            claimed = self.claim(1)
+            if not claimed:
+                return count
+            job_id, args = claimed[0]
+            self._run_inline(job_id, args)
+            count += 1
+
+    def _run_inline(self, job_id, args):
+        try:
+            result = run_task(self.task, *args)
+        except Exception as e:
+            self._report(self.fail, job_id, repr(e))
+        else:
+            self._report(self.complete, job_id, result)
+
+    def _report(self, callback, job_id, value):
+        try:
+            callback(job_id, value)
+        except Exception:
+            logger.exception('Could not record the outcome of job %s', job_id)
+
+    def _dispatch(self):
+        # Spawned workers do not inherit this process's threads, locks or DB connections
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=context) as pool:
+            running = {}
+            while True:
+                free = self.workers - len(running)
+                claimed = []
+                if free > 0:
+                    try:
+                        claimed = self.claim(free)
+                    except Exception:
+                        logger.exception('Could not claim jobs')
+                for job_id, args in claimed:
+                    running[pool.submit(run_task, self.task, *args)] = job_id
+
+                if not running:
+                    self._wakeup.wait(self.poll_interval)
+                    self._wakeup.clear()
+                    continue
+
+                done, _ = wait(running, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job_id = running.pop(future)
+                    error = future.exception()
+                    if error is not None:
+                        self._report(self.fail, job_id, repr(error))
+                    else:
+                        self._report(self.complete, job_id, future.result())
@@ -0,0 +1,257 @@
+"""Prometheus metrics aggregated over every process on the host.
+
+Each process records into in-memory series, which costs a dictionary
+update under a lock. A background thread writes the process's series to
+<directory>/<pid>.json every flush interval, and the process serving a
+scrape writes its own first, then adds up the files of all processes. A
+scrape therefore sees other workers' numbers as of their last flush.
+Counters and histograms of processes that have exited are folded into
+archive.json, so the totals never go backwards when a worker is replaced;
+gauges describe live processes only and carry a pid label. Each process
+holds a lock on <pid>.lock while it runs, which is how the others tell
+that it is gone.
+"""
+import bisect
+import json
+import os
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single process is assumed
+    fcntl = None
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Family:
+    def __init__(self, registry, kind, name, documentation, labels):
+        self.registry = registry
+        self.kind = kind
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.series = {}
+
+
+class Counter(_Family):
+    def inc(self, *label_values, amount=1):
+        with self.registry.lock:
+            self.series[label_values] = self.series.get(label_values, 0) + amount
+
+
+class Histogram(_Family):
+    def __init__(self, registry, name, documentation, labels, buckets):
+        super().__init__(registry, 'histogram', name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.registry.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                # Per-bucket (not cumulative) counts including +Inf, then sum
+                series = self.series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+
+class Gauge(_Family):
+    def __init__(self, registry, name, documentation, labels, collect):
+        super().__init__(registry, 'gauge', name, documentation, labels)
+        self.collect = collect  # Returns {label values: value}, read at every flush
+
+
+class MetricsRegistry:
+    """Metric families of the application, shared through files in directory"""
+
+    def __init__(self, directory, namespace, flush_interval=5.0):
+        self.directory = directory
+        self.namespace = namespace
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.families = {}
+        self._start_lock = threading.Lock()
+        self._pid = None
+        self._alive = None
+
+    def _add(self, family):
+        self.families[family.name] = family
+        return family
+
+    def counter(self, name, documentation, labels=()):
+        return self._add(Counter(self, 'counter', f'{self.namespace}_{name}', documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(self, f'{self.namespace}_{name}', documentation, labels, buckets))
+
+    def gauge(self, name, documentation, collect, labels=()):
+        return self._add(Gauge(self, f'{self.namespace}_{name}', documentation, labels, collect))
+
+    def start(self):
+        """Start flushing from this process; series recorded before a fork are dropped in the child"""
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # Forked: the parent's lock must be released when the parent exits, not when we do
+                self._alive.close()
+                with self.lock:
+                    for family in self.families.values():
+                        family.series.clear()
+            self._pid = os.getpid()
+            os.makedirs(self.directory, exist_ok=True)
+            self._alive = open(os.path.join(self.directory, f'{self._pid}.lock'), 'w')
+            if fcntl is not None:
+                fcntl.flock(self._alive, fcntl.LOCK_EX)
+            if self.flush_interval > 0:
+                threading.Thread(target=self._loop, name='metrics-flush', daemon=True).start()
+
+    def _loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except OSError:
+                pass  # Retried at the next interval
+
+    def snapshot(self):
+        values = {}
+        for family in self.families.values():
+            if family.kind == 'gauge':
+                try:
+                    series = family.collect()
+                except Exception:
+                    series = {}
+                values[family.name] = [[list(labels), value] for labels, value in series.items()]
+            else:
+                with self.lock:
+                    values[family.name] = [[list(labels), value if family.kind == 'counter' else list(value)]
+                                           for labels, value in family.series.items()]
+        return values
+
+    def flush(self):
+        """Write this process's series for the other processes to read"""
+        if self._pid != os.getpid():
+            self.start()
+        self._write(os.path.join(self.directory, f'{self._pid}.json'), self.snapshot())
+
+    def _write(self, path, values):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.part')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(values, f)
+        os.replace(tmp_path, path)
+
+    def _read(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _exited(self, pid):
+        if fcntl is None:
+            return False
+        try:
+            with open(os.path.join(self.directory, f'{pid}.lock'), 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+        except BlockingIOError:
+            return False
+
+    def _archive_exited(self):
+        """Fold the counters and histograms of processes that are gone into archive.json"""
+        exited = [name for name in os.listdir(self.directory)
+                  if name.endswith('.json') and name[:-5].isdigit()
+                  and int(name[:-5]) != self._pid and self._exited(name[:-5])]
+        if not exited:
+            return
+        archive_path = os.path.join(self.directory, 'archive.json')
+        archive = self._read(archive_path)
+        for name in exited:
+            self._merge(archive, self._totals(self._read(os.path.join(self.directory, name))))
+        self._write(archive_path, archive)
+        for name in exited:
+            for path in (name, name[:-5] + '.lock'):
+                try:
+                    os.remove(os.path.join(self.directory, path))
+                except FileNotFoundError:
+                    pass
+
+    def _totals(self, values):
+        """The counter and histogram series of a snapshot"""
+        return {name: series for name, series in values.items()
+                if name in self.families and self.families[name].kind != 'gauge'}
+
+    def _merge(self, total, values):
+        for name, series in values.items():
+            merged = {tuple(labels): value for labels, value in total.get(name, [])}
+            for labels, value in series:
+                labels = tuple(labels)
+                if labels not in merged:
+                    merged[labels] = value
+                elif isinstance(value, list):
+                    merged[labels] = [a + b for a, b in zip(merged[labels], value)]
+                else:
+                    merged[labels] = merged[labels] + value
+            total[name] = [[list(labels), value] for labels, value in merged.items()]
+
+    def render(self):
+        """Text exposition of the series of every process"""
+        self.flush()
+        gauges = {}
+        # Scrapes are serialised so none reads a snapshot while another archives it
+        with open(os.path.join(self.directory, 'archive.lock'), 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            self._archive_exited()
+            totals = self._read(os.path.join(self.directory, 'archive.json'))
+            for name in os.listdir(self.directory):
+                if not (name.endswith('.json') and name[:-5].isdigit()):
+                    continue
+                values = self._read(os.path.join(self.directory, name))
+                self._merge(totals, self._totals(values))
+                for key, series in values.items():
+                    if key in self.families and self.families[key].kind == 'gauge':
+                        gauges.setdefault(key, []).extend((name[:-5], labels, value) for labels, value in series)
+
+        lines = []
+        for family in self.families.values():
+            lines.append(f'# HELP {family.name} {family.documentation}')
+            lines.append(f'# TYPE {family.name} {family.kind}')
+            if family.kind == 'gauge':
+                for pid, labels, value in sorted(gauges.get(family.name, []), key=lambda item: item[:2]):
+                    lines.append(f'{family.name}{_labels(family.labels, labels, [("pid", pid)])} {_number(value)}')
+            elif family.kind == 'counter':
+                for labels, value in sorted(totals.get(family.name, []), key=lambda item: item[0]):
+                    lines.append(f'{family.name}{_labels(family.labels, labels)} {_number(value)}')
+            else:
+                for labels, value in sorted(totals.get(family.name, []), key=lambda item: item[0]):
+                    cumulative = 0
+                    for bound, count in zip(family.buckets + ('+Inf',), value):
+                        cumulative += count
+                        le = bound if bound == '+Inf' else _number(bound)
+                        lines.append(f'{family.name}_bucket{_labels(family.labels, labels, [("le", le)])} '
+                                     f'{cumulative}')
+                    lines.append(f'{family.name}_sum{_labels(family.labels, labels)} {_number(value[-1])}')
+                    lines.append(f'{family.name}_count{_labels(family.labels, labels)} {cumulative}')
+        return '\n'.join(lines) + '\n'
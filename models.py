@@ -0,0 +1,303 @@
+"""Database models and the bookkeeping that keeps derived data in step with them.
+
+Every commit bumps the shared version of each table it wrote to (see
+versions.VersionStore); dashboard counters, rating aggregates and the
+search index are written in the same transactions as the rows they
+describe. Only the application and its database are needed here, so
+init_db.py and the CLI commands load this without the web layer.
+"""
+import itertools
+from datetime import datetime
+
+from sqlalchemy import Float, case, cast, delete, event, func, insert, select, text, update
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.orm import Session
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from app import app, db
+from search import SearchIndex
+from versions import VersionStore
+
+# Models
+class User(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(80), unique=True, nullable=False)
+    password_hash = db.Column(db.String(255), nullable=False)  # Long enough for scrypt hashes
+    is_admin = db.Column(db.Boolean, default=False)  # Flag to identify admin users
+    
+    def set_password(self, password):
+        self.password_hash = generate_password_hash(password, app.config['PASSWORD_HASH_METHOD'])
+    
+    def check_password(self, password):
+        return check_password_hash(self.password_hash, password)
+
+class Gallery(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    description = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user = db.relationship('User', backref=db.backref('galleries', lazy=True))
+
+class PhotoTag(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), unique=True, nullable=False)
+
+photo_tags = db.Table('photo_tags',
+    db.Column('photo_id', db.Integer, db.ForeignKey('portfolio_item.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('tag_id', db.Integer, db.ForeignKey('photo_tag.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_photo_tags_tag', 'tag_id', 'photo_id')  # Tag filter lookups
+)
+
+class Category(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    description = db.Column(db.Text, nullable=False)
+    duration = db.Column(db.String(50))
+    price = db.Column(db.String(50))
+    image_filename = db.Column(db.String(200), index=True)
+    image_variants = db.Column(db.Text)  # JSON description of responsive derivatives
+    image_meta = db.Column(db.Text)  # JSON metadata extracted from the upload
+    processing_status = db.Column(db.String(20), default='ready')  # pending, ready or failed
+
+class PortfolioItem(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    title = db.Column(db.String(200), nullable=False)
+    description = db.Column(db.Text)  # New field for photo description
+    category_id = db.Column(db.Integer, db.ForeignKey('category.id', ondelete='CASCADE'), nullable=False)
+    gallery_id = db.Column(db.Integer, db.ForeignKey('gallery.id', ondelete='CASCADE'))  # New field for gallery association
+    image_filename = db.Column(db.String(200), nullable=False, index=True)
+    image_variants = db.Column(db.Text)  # JSON description of responsive derivatives
+    image_meta = db.Column(db.Text)  # JSON metadata extracted from the upload
+    processing_status = db.Column(db.String(20), default='ready')  # pending, ready or failed
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)  # New field for sorting
+    # Rating aggregates, maintained in the transactions that add, change or remove a Rating
+    rating_count = db.Column(db.Integer, default=0)
+    rating_sum = db.Column(db.Integer, default=0)
+    rating_average = db.Column(db.Float)  # None while unrated
+    # Children are removed by the database (see delete_portfolio_items), never loaded just to be deleted
+    category = db.relationship('Category', backref=db.backref('portfolio_items', lazy=True, passive_deletes=True))
+    gallery = db.relationship('Gallery', backref=db.backref('photos', lazy=True, passive_deletes=True))
+    tags = db.relationship('PhotoTag', secondary=photo_tags, lazy='subquery',
+                           backref=db.backref('photos', lazy=True))
+    # One index per filter combination of the portfolio listing, all ending in its sort key
+    __table_args__ = (
+        db.Index('ix_portfolio_item_created', 'created_at', 'id'),
+        db.Index('ix_portfolio_item_category_created', 'category_id', 'created_at', 'id'),
+        db.Index('ix_portfolio_item_gallery_created', 'gallery_id', 'created_at', 'id'),
+        db.Index('ix_portfolio_item_category_gallery_created', 'category_id', 'gallery_id', 'created_at', 'id'),
+        db.Index('ix_portfolio_item_rating', 'rating_average', 'rating_count'),
+        db.Index('ix_portfolio_item_rating_count', 'rating_count'),
+    )
+
+class Review(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    client_name = db.Column(db.String(100), nullable=False)
+    text = db.Column(db.Text, nullable=False)
+    date = db.Column(db.DateTime, default=datetime.utcnow)
+
+class Comment(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    author_name = db.Column(db.String(100), nullable=False)
+    text = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    portfolio_item_id = db.Column(db.Integer, db.ForeignKey('portfolio_item.id', ondelete='CASCADE'), nullable=False)
+    portfolio_item = db.relationship('PortfolioItem', backref=db.backref('comments', lazy=True, passive_deletes=True))
+
+class Rating(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    score = db.Column(db.Integer, nullable=False)  # 1-5 rating
+    user_ip = db.Column(db.String(45))  # Store IP to prevent multiple ratings
+    portfolio_item_id = db.Column(db.Integer, db.ForeignKey('portfolio_item.id', ondelete='CASCADE'), nullable=False)
+    portfolio_item = db.relationship('PortfolioItem', backref=db.backref('ratings', lazy=True, passive_deletes=True))
+    # One rating per visitor and photo; submissions upsert on it
+    __table_args__ = (
+        db.Index('ix_rating_item_ip', 'portfolio_item_id', 'user_ip', unique=True),
+    )
+
+class ImageJob(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    target_type = db.Column(db.String(20), nullable=False)  # 'portfolio_item' or 'category'
+    target_id = db.Column(db.Integer, nullable=False)
+    image_filename = db.Column(db.String(200), nullable=False)  # Upload the job was created for
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    __table_args__ = (db.Index('ix_image_job_status', 'status', 'id'),)
+
+class Request(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    client_name = db.Column(db.String(100), nullable=False)
+    phone = db.Column(db.String(20), nullable=False)
+    category_id = db.Column(db.Integer, db.ForeignKey('category.id', ondelete='SET NULL'))
+    message = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    intake_id = db.Column(db.String(32))  # Journal key of requests taken in write-behind mode
+    category = db.relationship('Category', backref=db.backref('requests', lazy=True, passive_deletes=True))
+    # Keyset order of the admin listing, overall and within a category
+    __table_args__ = (
+        db.Index('ix_request_created', 'created_at', 'id'),
+        db.Index('ix_request_category_created', 'category_id', 'created_at', 'id'),
+        db.Index('ix_request_intake', 'intake_id', unique=True),  # Replayed journal entries are skipped
+    )
+
+# Dashboard statistics, written in the same transaction as the rows they count (see record_stats)
+class SiteCounter(db.Model):
+    name = db.Column(db.String(50), primary_key=True)  # Name of the counted table
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+class RequestDayCount(db.Model):
+    day = db.Column(db.Date, primary_key=True)  # UTC date of Request.created_at
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+def dialect_insert(model):
+    """INSERT statement with on_conflict_do_update/do_nothing for the configured database"""
+    if db.engine.dialect.name == 'postgresql':
+        # Only imported on PostgreSQL: the dialect package is slow to import
+        from sqlalchemy.dialects import postgresql
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+
+# Per-table change counters, bumped after every commit that wrote to the table
+table_versions = VersionStore(app.config['TABLE_VERSION_FOLDER'])
+commit_hooks = []  # Called with the tables each such commit wrote to; web.py drops their cached pages
+
+@event.listens_for(Session, 'after_flush')
+def collect_written_tables(session, flush_context):
+    tables = session.info.setdefault('written_tables', set())
+    for obj in itertools.chain(session.new, session.dirty, session.deleted):
+        tables.add(obj.__table__.name)
+
+@event.listens_for(Session, 'do_orm_execute')
+def collect_bulk_writes(orm_execute_state):
+    # Statements run with execution_options(versioned=False) change nothing cached pages depend on
+    if not orm_execute_state.execution_options.get('versioned', True):
+        return
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = orm_execute_state.statement.table
+        orm_execute_state.session.info.setdefault('written_tables', set()).add(table.name)
+
+@event.listens_for(Session, 'after_commit')
+def bump_written_tables(session):
+    tables = session.info.pop('written_tables', None)
+    if tables:
+        table_versions.bump(sorted(tables))
+        for hook in commit_hooks:
+            hook(tables)
+
+@event.listens_for(Session, 'after_rollback')
+def forget_written_tables(session):
+    session.info.pop('written_tables', None)
+
+# Dashboard statistics
+COUNTED_MODELS = (Request, PortfolioItem, Review, Comment, Rating)
+COUNTED_TABLES = {model.__table__.name for model in COUNTED_MODELS}
+
+def record_stats(session, counts, request_days=None):
+    """Add row count deltas ({table name: delta}) and per-day request deltas ({date: delta}).
+
+    The upserts run on session's connection, so they commit or roll back
+    together with the writes they describe.
+    """
+    counts = sorted((name, delta) for name, delta in counts.items() if delta)
+    if counts:
+        stmt = dialect_insert(SiteCounter)
+        session.execute(stmt.on_conflict_do_update(index_elements=['name'],
+                                                   set_={'value': SiteCounter.value + stmt.excluded.value}),
+                        [{'name': name, 'value': delta} for name, delta in counts])
+    days = sorted((day, delta) for day, delta in (request_days or {}).items() if delta)
+    if days:
+        stmt = dialect_insert(RequestDayCount)
+        session.execute(stmt.on_conflict_do_update(index_elements=['day'],
+                                                   set_={'count': RequestDayCount.count + stmt.excluded.count}),
+                        [{'day': day, 'count': delta} for day, delta in days])
+
+@event.listens_for(Session, 'after_flush')
+def count_flushed_rows(session, flush_context):
+    # Set-based statements bypass the flush; their callers call record_stats() themselves
+    counts, request_days = {}, {}
+    for objects, delta in ((session.new, 1), (session.deleted, -1)):
+        for obj in objects:
+            table = obj.__table__.name
+            if table not in COUNTED_TABLES:
+                continue
+            counts[table] = counts.get(table, 0) + delta
+            if isinstance(obj, Request) and obj.created_at:
+                day = obj.created_at.date()
+                request_days[day] = request_days.get(day, 0) + delta
+    if counts:
+        record_stats(session, counts, request_days)
+
+def recount_stats():
+    """Rebuild the dashboard counters and daily request counts from the counted tables"""
+    db.session.execute(delete(SiteCounter))
+    db.session.execute(insert(SiteCounter), [
+        {'name': model.__table__.name, 'value': db.session.scalar(select(func.count()).select_from(model))}
+        for model in COUNTED_MODELS])
+    db.session.execute(delete(RequestDayCount))
+    day = func.date(Request.created_at)
+    db.session.execute(insert(RequestDayCount).from_select(
+        ['day', 'count'],
+        select(day, func.count()).where(Request.created_at.isnot(None)).group_by(day)))
+
+# Rating aggregates of portfolio items (see portfolio.submit_rating)
+def recount_ratings():
+    """Recompute every item's rating aggregates from the Rating table"""
+    of_item = Rating.portfolio_item_id == PortfolioItem.id
+    db.session.execute(update(PortfolioItem).values(
+        rating_count=select(func.count(Rating.id)).where(of_item).scalar_subquery(),
+        rating_sum=select(func.coalesce(func.sum(Rating.score), 0)).where(of_item).scalar_subquery())
+        .execution_options(synchronize_session=False))
+    db.session.execute(update(PortfolioItem).values(
+        rating_average=case((PortfolioItem.rating_count > 0,
+                             cast(PortfolioItem.rating_sum, Float) / PortfolioItem.rating_count), else_=None))
+        .execution_options(synchronize_session=False))
+
+# Full-text search
+search_index = SearchIndex()
+
+def rebuild_search_index():
+    rows = ((item.id, item.title, item.description, [tag.name for tag in item.tags])
+            for item in PortfolioItem.query.all())
+    search_index.rebuild(db.session, rows)
+
+# Schema
+def upgrade_schema():
+    """Add columns and indexes that were introduced after the tables were first created"""
+    inspector = db.inspect(db.engine)
+    added = set()
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing and column.nullable:
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                db.session.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'))
+                added.add((table.name, column.name))
+    
+    # Dashboard counters are built from scratch when their table is new
+    stale_stats = db.session.scalar(select(SiteCounter.name).limit(1)) is None
+    
+    # Rows left behind by deletes from before the schema cascaded
+    for table, column in ((photo_tags, photo_tags.c.photo_id), (Comment.__table__, Comment.portfolio_item_id),
+                          (Rating.__table__, Rating.portfolio_item_id)):
+        if db.session.execute(delete(table).where(column.not_in(select(PortfolioItem.id)))).rowcount:
+            stale_stats = True
+    
+    if ('portfolio_item', 'rating_count') in added:
+        # Keep each visitor's latest rating so the unique index can be built, then backfill the aggregates
+        db.session.execute(text(
+            'DELETE FROM rating WHERE user_ip IS NOT NULL AND id NOT IN '
+            '(SELECT MAX(id) FROM rating WHERE user_ip IS NOT NULL GROUP BY portfolio_item_id, user_ip)'))
+        recount_ratings()
+        stale_stats = True
+    if stale_stats:
+        recount_stats()
+    db.session.commit()
+
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=db.engine, checkfirst=True)
@@ -0,0 +1,34 @@
+"""Prometheus scrape endpoint."""
+import hmac
+import ipaddress
+
+from flask import Blueprint, Response, abort, current_app, request
+
+from web import limiter, metrics
+
+monitoring_bp = Blueprint('monitoring', __name__)
+
+def trusted_address(address, networks):
+    """True if address is inside one of the comma separated networks"""
+    try:
+        address = ipaddress.ip_address(address or '')
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(network.strip(), strict=False)
+               for network in networks.split(',') if network.strip())
+
+@monitoring_bp.route('/metrics')
+@limiter.exempt
+def metrics_export():
+    token = current_app.config['METRICS_TOKEN']
+    networks = current_app.config['METRICS_NETWORKS']
+    # Closed unless a token or a scraper network is configured
+    if not token and not networks:
+        abort(404)
+    authorized = bool(token) and hmac.compare_digest(request.headers.get('Authorization', '').encode(),
+                                                     f'Bearer {token}'.encode())
+    if not authorized and not trusted_address(request.remote_addr, networks):
+        abort(401)
+    response = Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+    response.cache_control.no_store = True
+    return response
@@ -0,0 +1,184 @@
+"""Whole-response cache for public pages.
+
+Each cached view declares the tables it renders from. An entry remembers
+the versions of those tables (see versions.VersionStore) at render time
+and is only served while they are unchanged, so a commit invalidates
+exactly the pages that depend on the tables it wrote, in every process.
+Entries also record the build of the code that rendered them (see
+source_build()), so pages stored on disk before a deploy are not served
+by the new code.
+Responses carry a strong content-hash ETag and Last-Modified, and
+conditional requests are answered with 304 Not Modified.
+"""
+import functools
+import hashlib
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from urllib.parse import urlencode
+
+from flask import current_app, make_response, request, session
+
+
+def source_build(paths):
+    """Identifier that changes when any file under paths is added, removed or replaced"""
+    digest = hashlib.sha256()
+    for top in paths:
+        walk = os.walk(top) if os.path.isdir(top) else [(os.path.dirname(top), [], [os.path.basename(top)])]
+        for directory, dirnames, filenames in walk:
+            dirnames.sort()
+            for filename in sorted(filenames):
+                path = os.path.join(directory, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                digest.update(f'{path}\0{stat.st_size}\0{stat.st_mtime_ns}\n'.encode())
+    return digest.hexdigest()[:16]
+
+
+class MemoryBackend:
+    """Per-process LRU of entries, grouped by endpoint"""
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, endpoint, key):
+        with self._lock:
+            entry = self._entries.get((endpoint, key))
+            if entry is not None:
+                self._entries.move_to_end((endpoint, key))
+            return entry
+
+    def set(self, endpoint, key, entry):
+        with self._lock:
+            self._entries[(endpoint, key)] = entry
+            self._entries.move_to_end((endpoint, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def purge(self, endpoint):
+        with self._lock:
+            for cache_key in [k for k in self._entries if k[0] == endpoint]:
+                del self._entries[cache_key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class DiskBackend:
+    """Entries pickled to one file each, shared by every process on the host"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, endpoint, key):
+        return os.path.join(self.directory, endpoint, hashlib.sha256(key.encode()).hexdigest())
+
+    def get(self, endpoint, key):
+        try:
+            with open(self._path(endpoint, key), 'rb') as f:
+                return pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def set(self, endpoint, key, entry):
+        path = self._path(endpoint, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def purge(self, endpoint):
+        shutil.rmtree(os.path.join(self.directory, endpoint), ignore_errors=True)
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class PageCache:
+    """Decorator factory caching GET responses of views until their tables change"""
+
+    def __init__(self, backend, versions, max_age=0, shared_max_age=60, on_lookup=None, build=None):
+        self.backend = backend
+        self.versions = versions
+        self.build = build  # Entries of any other build are misses
+        self.max_age = max_age
+        self.shared_max_age = shared_max_age
+        self.on_lookup = on_lookup  # Called with (endpoint, hit) after every lookup
+        self._dependencies = {}
+
+    def cached(self, *tables):
+        """Cache a view that renders only from the given tables"""
+        def decorator(view):
+            endpoint = view.__name__
+            self._dependencies[endpoint] = frozenset(tables)
+
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                # Pending flash messages make the next page personal
+                if self.backend is None or request.method not in ('GET', 'HEAD') or '_flashes' in session:
+                    return view(*args, **kwargs)
+
+                key = request.path + '?' + urlencode(sorted(request.args.items(multi=True)))
+                versions = self.versions.versions(tables)
+                entry = self.backend.get(endpoint, key)
+                hit = (entry is not None and entry['versions'] == versions
+                       and entry.get('build') == self.build)
+                if self.on_lookup is not None:
+                    self.on_lookup(endpoint, hit)
+                if not hit:
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code != 200 or session.accessed:
+                        return response
+                    entry = self._entry(response, versions)
+                    self.backend.set(endpoint, key, entry)
+                return self._respond(entry)
+            return wrapper
+        return decorator
+
+    def _entry(self, response, versions):
+        body = response.get_data()
+        return {
+            'versions': versions,
+            'build': self.build,
+            'body': body,
+            'mimetype': response.mimetype,
+            'etag': hashlib.sha256(body).hexdigest()[:32],
+            'last_modified': datetime.now(timezone.utc).replace(microsecond=0),
+        }
+
+    def _respond(self, entry):
+        response = current_app.response_class(entry['body'], mimetype=entry['mimetype'])
+        response.set_etag(entry['etag'])
+        response.last_modified = entry['last_modified']
+        response.cache_control.public = True
+        response.cache_control.max_age = self.max_age
+        response.cache_control.s_maxage = self.shared_max_age
+        return response.make_conditional(request)
+
+    def purge(self, tables):
+        """Drop stored pages of every view rendered from any of tables"""
+        if self.backend is None:
+            return
+        tables = set(tables)
+        for endpoint, dependencies in self._dependencies.items():
+            if dependencies & tables:
+                self.backend.purge(endpoint)
+
+    def clear(self):
+        if self.backend is not None:
+            self.backend.clear()
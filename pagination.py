@@ -0,0 +1,145 @@
+"""Keyset (cursor) pagination over ``(created_at, id)`` style sort keys, or ``id`` alone.
+
+Unlike OFFSET pagination, every page is a single index range scan, so
+deep pages cost the same as the first one.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from sqlalchemy import tuple_
+
+
+def encode_cursor(created_at, id):
+    raw = json.dumps([created_at.isoformat() if created_at is not None else None, id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return the (created_at, id) key of a cursor, or None if it is malformed"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, id = json.loads(raw)
+        return datetime.fromisoformat(created_at) if created_at is not None else None, int(id)
+    except (binascii.Error, ValueError, TypeError):
+        return None
+
+
+def _comparable(cursor_key, created_column):
+    """The part of a decoded cursor to compare with the sort key; None if it doesn't fit"""
+    if cursor_key is None:
+        return None
+    if created_column is None:
+        return cursor_key[1]
+    return cursor_key if cursor_key[0] is not None else None
+
+
+class KeysetPage:
+    """One page of results plus the cursors of its neighbours"""
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+
+def keyset_paginate(query, created_column, id_column, per_page, after=None, before=None):
+    """Return the page of query (newest first) that follows ``after`` or precedes ``before``.
+
+    ``after`` and ``before`` are cursors produced by a previous page. The
+    query must not be ordered yet. With ``created_column=None`` rows are
+    ordered by ``id_column`` alone, for tables without a creation time.
+    """
+    if created_column is None:
+        columns = (id_column,)
+        key = id_column
+    else:
+        columns = (created_column, id_column)
+        key = tuple_(created_column, id_column)
+    after_key = _comparable(decode_cursor(after), created_column)
+    before_key = _comparable(decode_cursor(before), created_column)
+
+    if before_key is not None:
+        # Walk towards newer rows, then flip back to newest-first order
+        rows = (query.filter(key > before_key)
+                .order_by(*(column.asc() for column in columns))
+                .limit(per_page + 1).all())
+        has_newer = len(rows) > per_page
+        rows = rows[:per_page][::-1]
+        has_older = True
+    else:
+        if after_key is not None:
+            query = query.filter(key < after_key)
+        rows = (query.order_by(*(column.desc() for column in columns))
+                .limit(per_page + 1).all())
+        has_older = len(rows) > per_page
+        rows = rows[:per_page]
+        has_newer = after_key is not None
+
+    def cursor_for(row):
+        created_at = getattr(row, created_column.key) if created_column is not None else None
+        return encode_cursor(created_at, getattr(row, id_column.key))
+
+    next_cursor = prev_cursor = None
+    if rows:
+        if has_older:
+            next_cursor = cursor_for(rows[-1])
+        if has_newer:
+            prev_cursor = cursor_for(rows[0])
+    return KeysetPage(rows, next_cursor, prev_cursor)
+
+
+class KeysetStream:
+    """A forward page whose rows are fetched lazily in batches.
+
+    Iterate it once; ``next_cursor`` and ``prev_cursor`` are only known
+    after iteration has finished.
+    """
+
+    def __init__(self, query, created_column, id_column, per_page, after=None, batch_size=100):
+        self.query = query
+        self.created_column = created_column
+        self.id_column = id_column
+        self.per_page = per_page
+        self.after = after
+        self.batch_size = batch_size
+        self.next_cursor = None
+        self.prev_cursor = None
+
+    def _cursor_for(self, row):
+        return encode_cursor(getattr(row, self.created_column.key), getattr(row, self.id_column.key))
+
+    def __iter__(self):
+        after_key = decode_cursor(self.after)
+        query = self.query
+        if after_key is not None:
+            query = query.filter(tuple_(self.created_column, self.id_column) < after_key)
+        query = (query.order_by(self.created_column.desc(), self.id_column.desc())
+                 .limit(self.per_page + 1).yield_per(self.batch_size))
+
+        count = 0
+        last = None
+        for row in query:
+            if count == self.per_page:
+                # The probe row exists: there is an older page
+                self.next_cursor = self._cursor_for(last)
+                break
+            if count == 0 and after_key is not None:
+                self.prev_cursor = self._cursor_for(row)
+            count += 1
+            last = row
+            yield row
@@ -0,0 +1,61 @@
+"""Password hashing off the request threads.
+
+Hashes are computed on a small per-process thread pool (hashlib releases
+the GIL, so the threads really run in parallel). Requests still wait for
+their result, but only a bounded number of hashes can be running or
+queued at once; beyond that verify() fails fast with HasherBusy instead
+of letting a burst of login attempts tie up every worker.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class HasherBusy(Exception):
+    """Raised instead of queueing when too many hashes are pending"""
+
+
+class PasswordHasher:
+    """Bounded executor for werkzeug password hashes.
+
+    method is a werkzeug method string with explicit parameters, such as
+    'pbkdf2:sha256:600000' or 'scrypt:32768:8:1'; stored hashes made with
+    different parameters are reported by needs_rehash().
+    """
+
+    def __init__(self, method, workers=1, max_pending=4):
+        self.method = method
+        self.workers = workers
+        self.max_pending = max_pending
+        self._slots = threading.BoundedSemaphore(workers + max_pending)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+    def _submit(self, function, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy()
+        try:
+            if self._pid != os.getpid():
+                with self._lock:
+                    if self._pid != os.getpid():
+                        # A forked worker inherits the parent's executor but not its threads
+                        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='password')
+                        self._pid = os.getpid()
+            future = self._executor.submit(function, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future.result()
+
+    def hash(self, password):
+        return self._submit(generate_password_hash, password, self.method)
+
+    def verify(self, stored_hash, password):
+        return self._submit(check_password_hash, stored_hash, password)
+
+    def needs_rehash(self, stored_hash):
+        return stored_hash.split('$', 1)[0] != self.method
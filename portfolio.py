@@ -0,0 +1,238 @@
+"""Portfolio items: bulk writes, search index updates, tags, ratings and listings."""
+import os
+from datetime import datetime
+
+from flask import request
+from sqlalchemy import Float, case, cast, delete, insert, select, update
+
+from app import app, db
+from models import (Category, Comment, ImageJob, PhotoTag, PortfolioItem, Rating, dialect_insert, photo_tags,
+                    record_stats, search_index)
+from pagination import keyset_paginate
+from uploads import image_jobs, store_stream
+
+# Writes
+def delete_portfolio_items(condition):
+    """Delete the portfolio items matching condition with set-based statements.
+
+    Tags, comments and ratings of the items go with them (the schema
+    cascades too, but older databases were created without ON DELETE).
+    Returns the items' files, to pass to release_uploads() after commit.
+    """
+    rows = db.session.execute(select(PortfolioItem.id, PortfolioItem.image_filename, PortfolioItem.image_variants)
+                              .where(condition)).all()
+    if not rows:
+        return []
+    item_ids = select(PortfolioItem.id).where(condition)
+    search_index.remove(db.session, [row.id for row in rows])
+    db.session.execute(delete(photo_tags).where(photo_tags.c.photo_id.in_(item_ids)))
+    removed = {}
+    for model in (Comment, Rating):
+        removed[model.__table__.name] = -db.session.execute(
+            delete(model).where(model.portfolio_item_id.in_(item_ids))
+            .execution_options(synchronize_session=False)).rowcount
+    removed['portfolio_item'] = -db.session.execute(
+        delete(PortfolioItem).where(condition).execution_options(synchronize_session=False)).rowcount
+    record_stats(db.session, removed)
+    return list({(row.image_filename, row.image_variants) for row in rows})
+
+def insert_portfolio_batch(rows, tag_ids):
+    """Insert portfolio items from column dicts with a handful of statements; returns their ids.
+
+    Files that were already processed for another row reuse its results,
+    every other distinct file gets one ImageJob. Call image_jobs.wake()
+    after committing.
+    """
+    filenames = {row['image_filename'] for row in rows}
+    processed = {}
+    for model in (PortfolioItem, Category):
+        processed.update((filename, (variants, meta)) for filename, variants, meta in db.session.execute(
+            select(model.image_filename, model.image_variants, model.image_meta)
+            .where(model.image_filename.in_(filenames), model.processing_status == 'ready',
+                   model.image_variants.isnot(None))))
+    
+    now = datetime.utcnow()
+    for row in rows:
+        variants, meta = processed.get(row['image_filename'], (None, None))
+        row.update(image_variants=variants, image_meta=meta, processing_status='ready' if variants else 'pending',
+                   created_at=now, rating_count=0, rating_sum=0)
+    ids = db.session.scalars(insert(PortfolioItem).returning(PortfolioItem.id, sort_by_parameter_order=True),
+                             rows).all()
+    
+    jobs = {}
+    for item_id, row in zip(ids, rows):
+        if row['processing_status'] == 'pending':
+            jobs.setdefault(row['image_filename'], item_id)
+    if jobs:
+        db.session.execute(insert(ImageJob), [
+            {'target_type': 'portfolio_item', 'target_id': item_id, 'image_filename': filename,
+             'status': 'queued', 'attempts': 0, 'created_at': now, 'updated_at': now}
+            for filename, item_id in jobs.items()])
+    if tag_ids:
+        db.session.execute(insert(photo_tags), [{'photo_id': item_id, 'tag_id': tag_id}
+                                                for item_id in ids for tag_id in tag_ids])
+    record_stats(db.session, {'portfolio_item': len(ids)})
+    return ids
+
+def import_portfolio_files(files, title, description, category_id, gallery_id, tag_names):
+    """Create a portfolio item for every image in files, expanding ZIP archives.
+
+    Items are inserted and committed in batches of IMPORT_BATCH_SIZE so the
+    image workers start on the first photos while the rest are stored.
+    Returns a list of created {'id', 'filename', 'status'} dicts and a list
+    of skipped (filename, reason) pairs.
+    """
+    import zipfile
+    from bulkimport import expand_uploads
+    tag_ids = list(resolve_tags(tag_names).values())
+    created = []
+    skipped = []
+    batch = []
+    source_names = []
+    
+    def flush_batch():
+        ids = insert_portfolio_batch(batch, tag_ids)
+        for item_id, row, source_name in zip(ids, batch, source_names):
+            search_index.update(db.session, item_id, row['title'], row['description'], tag_names)
+            created.append({'id': item_id, 'filename': source_name, 'status': row['processing_status']})
+        db.session.commit()
+        image_jobs.wake()
+        batch.clear()
+        source_names.clear()
+    
+    for filename, stream in expand_uploads(files, skipped):
+        try:
+            stored = store_stream(stream, filename)
+        except (OSError, EOFError, zipfile.BadZipFile) as e:
+            skipped.append((filename, f'ошибка чтения: {e}'))
+            continue
+        number = len(created) + len(batch) + 1
+        batch.append({
+            'title': f'{title} {number}' if title else os.path.splitext(filename)[0][:200],
+            'description': description,
+            'category_id': category_id,
+            'gallery_id': gallery_id,
+            'image_filename': stored,
+        })
+        source_names.append(filename)
+        if len(batch) >= app.config['IMPORT_BATCH_SIZE']:
+            flush_batch()
+    if batch:
+        flush_batch()
+    return created, skipped
+
+# Full-text search
+def reindex_portfolio_items(items, exclude_tag=None):
+    """Refresh the search index for items inside the current transaction"""
+    db.session.flush()
+    for item in items:
+        tag_names = [tag.name for tag in item.tags if tag is not exclude_tag]
+        search_index.update(db.session, item.id, item.title, item.description, tag_names)
+
+# Ratings
+RATING_SCORES = range(1, 6)
+
+def apply_rating_delta(item_id, count_delta, sum_delta):
+    """Adjust an item's rating aggregates in place; returns the new (count, average)"""
+    count = PortfolioItem.rating_count + count_delta
+    total = PortfolioItem.rating_sum + sum_delta
+    return db.session.execute(
+        update(PortfolioItem).where(PortfolioItem.id == item_id)
+        .values(rating_count=count, rating_sum=total,
+                rating_average=case((count > 0, cast(total, Float) / count), else_=None))
+        .returning(PortfolioItem.rating_count, PortfolioItem.rating_average)
+        .execution_options(synchronize_session=False, versioned=False)).one()
+
+def submit_rating(item_id, user_ip, score):
+    """Record a visitor's score for an item, replacing their previous one, and commit.
+
+    Returns the item's new (rating_count, rating_average), or None if the item does not exist.
+    """
+    # Write to the item row first: it holds the row lock (the database lock on SQLite)
+    # until commit, so concurrent ratings of one item can't compute deltas from stale scores.
+    # The aggregates don't bump the portfolio_item version: a rating must not empty the page
+    # cache, so cached pages show them as of their last content change (the script updates
+    # the stars it rated itself)
+    locked = db.session.execute(update(PortfolioItem).where(PortfolioItem.id == item_id)
+                                .values(rating_count=PortfolioItem.rating_count)
+                                .execution_options(synchronize_session=False, versioned=False))
+    if locked.rowcount == 0:
+        db.session.rollback()
+        return None
+    previous = db.session.execute(select(Rating.score).where(Rating.portfolio_item_id == item_id,
+                                                             Rating.user_ip == user_ip)).scalar()
+    db.session.execute(dialect_insert(Rating).values(portfolio_item_id=item_id, user_ip=user_ip, score=score)
+                       .on_conflict_do_update(index_elements=['portfolio_item_id', 'user_ip'],
+                                              set_={'score': score}))
+    if previous is None:
+        record_stats(db.session, {'rating': 1})
+        aggregates = apply_rating_delta(item_id, 1, score)
+    else:
+        aggregates = apply_rating_delta(item_id, 0, score - previous)
+    db.session.commit()
+    return aggregates
+
+# Tags
+def parse_tag_names(value):
+    """Distinct lower-case tag names from a comma separated field, in input order"""
+    return list(dict.fromkeys(name.strip().lower() for name in (value or '').split(',') if name.strip()))
+
+def resolve_tags(names):
+    """Map tag names to PhotoTag ids, creating the missing tags in one statement"""
+    if not names:
+        return {}
+    ids = dict(db.session.execute(select(PhotoTag.name, PhotoTag.id).where(PhotoTag.name.in_(names))).all())
+    missing = [name for name in names if name not in ids]
+    if missing:
+        # A concurrent request may create the same tags: skip those and read them back below
+        db.session.execute(dialect_insert(PhotoTag).values([{'name': name} for name in missing])
+                           .on_conflict_do_nothing(index_elements=['name']))
+        ids.update(db.session.execute(select(PhotoTag.name, PhotoTag.id)
+                                      .where(PhotoTag.name.in_(missing))).all())
+    return ids
+
+def set_portfolio_tags(portfolio_item, names):
+    """Make names the item's tags, writing only the photo_tags rows that change"""
+    db.session.flush()
+    wanted = set(resolve_tags(names).values())
+    current = set(db.session.scalars(select(photo_tags.c.tag_id)
+                                     .where(photo_tags.c.photo_id == portfolio_item.id)))
+    added = wanted - current
+    removed = current - wanted
+    if added:
+        db.session.execute(insert(photo_tags), [{'photo_id': portfolio_item.id, 'tag_id': tag_id}
+                                                for tag_id in added])
+    if removed:
+        db.session.execute(delete(photo_tags).where(photo_tags.c.photo_id == portfolio_item.id,
+                                                    photo_tags.c.tag_id.in_(removed)))
+    # The loaded collection no longer matches the table
+    db.session.expire(portfolio_item, ['tags'])
+
+# Portfolio listings
+def portfolio_query(category_id=None, gallery_id=None, tag_name=None):
+    """Portfolio items matching the public listing filters, not yet ordered"""
+    query = PortfolioItem.query
+    
+    if category_id:
+        query = query.filter_by(category_id=category_id)
+    if gallery_id:
+        query = query.filter_by(gallery_id=gallery_id)
+    if tag_name:
+        # Exact match: served by the unique tag name index and ix_photo_tags_tag
+        query = query.join(PortfolioItem.tags).filter(PhotoTag.name == tag_name)
+    return query
+
+def search_portfolio(query, text_query):
+    """Restrict query to items matching text_query, ordered best match first"""
+    hits = search_index.matches(db.session, text_query)
+    if hits is None:
+        # No FTS5 (e.g. a server database): plain substring matching, newest first
+        pattern = f'%{text_query}%'
+        return (query.filter(db.or_(PortfolioItem.title.ilike(pattern), PortfolioItem.description.ilike(pattern)))
+                .order_by(PortfolioItem.created_at.desc(), PortfolioItem.id.desc()))
+    return query.join(hits, PortfolioItem.id == hits.c.item_id).order_by(hits.c.rank, PortfolioItem.id.desc())
+
+def paginate_portfolio(query, per_page):
+    """Keyset page of query driven by the 'cursor' / 'before' request arguments"""
+    return keyset_paginate(query, PortfolioItem.created_at, PortfolioItem.id, per_page,
+                           after=request.args.get('cursor'), before=request.args.get('before'))
@@ -0,0 +1,186 @@
+"""Sampling profiler for single requests.
+
+A Profile samples the Python stack of one thread from a background thread
+every interval seconds and counts the stacks it sees, so the request it
+watches runs at full speed between samples. Stacks are saved in the folded
+format ("outer;inner;leaf count" per line) that flamegraph.pl, speedscope
+and inferno read, next to a JSON summary with the request, its SQL
+statements and its template renders. ProfileStore keeps the newest files
+of a directory and drops the rest.
+"""
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from sqlstats import statement_shape
+
+_NAME = re.compile(r'^[\w.-]+$')
+_UNSAFE = re.compile(r'[^\w.-]+')
+
+
+def _frame_label(code, root):
+    filename = code.co_filename
+    if filename.startswith(root):
+        filename = filename[len(root):]
+    else:
+        # Library code: keep the package directory and module
+        filename = '/'.join(filename.replace(os.sep, '/').split('/')[-2:])
+    return f'{code.co_name} ({filename}:{code.co_firstlineno})'.replace(';', ':')
+
+
+class Profile:
+    """Stack samples, SQL statements and template renders of one request"""
+
+    def __init__(self, thread_id, interval=0.005, root=''):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.root = root
+        self.stacks = {}  # folded stack -> samples
+        self.templates = []  # (name, seconds)
+        self.recorder = None  # sqlstats.QueryRecorder of the request
+        self.started = None
+        self.duration = None
+        self._labels = {}
+        self._rendering = []
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target=self._sample, name='profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self.started
+
+    def _sample(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                label = self._labels.get(frame.f_code)
+                if label is None:
+                    label = self._labels[frame.f_code] = _frame_label(frame.f_code, self.root)
+                stack.append(label)
+                frame = frame.f_back
+            if stack:
+                key = ';'.join(reversed(stack))
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+
+    def template_started(self, name):
+        self._rendering.append((name, time.perf_counter()))
+
+    def template_finished(self):
+        if self._rendering:
+            name, started = self._rendering.pop()
+            self.templates.append((name, time.perf_counter() - started))
+
+    def folded(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in sorted(self.stacks.items()))
+
+    def summary(self, **request_info):
+        """JSON-ready description of the profile; request_info is stored as given"""
+        shapes = {}
+        if self.recorder is not None:
+            for statement, (count, seconds) in self.recorder.shapes.items():
+                entry = shapes.setdefault(statement_shape(statement), [0, 0.0])
+                entry[0] += count
+                entry[1] += seconds
+        own = {}
+        for stack, count in self.stacks.items():
+            leaf = stack.rsplit(';', 1)[-1]
+            own[leaf] = own.get(leaf, 0) + count
+        return dict(
+            request_info,
+            duration=self.duration,
+            interval=self.interval,
+            samples=sum(self.stacks.values()),
+            queries=self.recorder.count if self.recorder is not None else 0,
+            db_time=self.recorder.duration if self.recorder is not None else 0.0,
+            statements=sorted(([shape, count, seconds] for shape, (count, seconds) in shapes.items()),
+                              key=lambda entry: -entry[2])[:50],
+            templates=self.templates,
+            template_time=sum(seconds for _, seconds in self.templates),
+            hottest=sorted(own.items(), key=lambda item: -item[1])[:30],
+        )
+
+
+class ProfileStore:
+    """Saved profiles as <name>.folded and <name>.json files in directory"""
+
+    def __init__(self, directory, keep=100):
+        self.directory = directory
+        self.keep = keep
+
+    def new_name(self, endpoint):
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        return f'{stamp}-{_UNSAFE.sub("_", endpoint or "unmatched")}-{uuid.uuid4().hex[:8]}'
+
+    def path(self, name, extension):
+        """Path of a saved file; None if name is not one this store could have made"""
+        if not _NAME.match(name) or extension not in ('folded', 'json'):
+            return None
+        return os.path.join(self.directory, f'{name}.{extension}')
+
+    def save(self, name, profile, summary):
+        os.makedirs(self.directory, exist_ok=True)
+        # The summary is written last: list() only shows profiles that have one
+        for extension, content in (('folded', profile.folded()), ('json', json.dumps(summary))):
+            tmp_path = self.path(name, extension) + '.part'
+            with open(tmp_path, 'w') as f:
+                f.write(content)
+            os.replace(tmp_path, self.path(name, extension))
+        self._prune()
+
+    def load(self, name):
+        path = self.path(name, 'json')
+        if path is None:
+            return None
+        try:
+            with open(path) as f:
+                return dict(json.load(f), name=name)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def names(self):
+        """Names of the saved profiles, newest first"""
+        try:
+            files = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        # Names start with the time to the second; the modification time orders profiles within one
+        found = []
+        for name in files:
+            if name.endswith('.json'):
+                try:
+                    found.append((os.path.getmtime(os.path.join(self.directory, name)), name[:-5]))
+                except FileNotFoundError:
+                    pass
+        return [name for _, name in sorted(found, reverse=True)]
+
+    def list(self):
+        return [summary for summary in map(self.load, self.names()) if summary is not None]
+
+    def delete(self, name):
+        for extension in ('json', 'folded'):
+            path = self.path(name, extension)
+            if path is not None:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def clear(self):
+        for name in self.names():
+            self.delete(name)
+
+    def _prune(self):
+        for name in self.names()[self.keep:]:
+            self.delete(name)
@@ -0,0 +1,111 @@
+"""Public pages of the site."""
+from flask import Blueprint, flash, jsonify, redirect, render_template, request, url_for
+from flask_wtf.csrf import generate_csrf
+
+from app import db
+from client_requests import accept_request
+from models import PortfolioItem, Review
+from portfolio import portfolio_query, search_portfolio, paginate_portfolio
+from public_forms import QuickRequestForm, ContactForm
+from web import page_cache, cached_categories, cached_galleries, cached_tags, category_choices
+
+public_bp = Blueprint('public', __name__)
+
+@public_bp.route('/csrf-token')
+def csrf_token():
+    """CSRF token for forms on cached pages, which are rendered without one"""
+    response = jsonify({'csrf_token': generate_csrf()})
+    response.cache_control.no_store = True
+    return response
+
+@public_bp.route('/')
+@page_cache.cached('category', 'portfolio_item')
+def index():
+    categories = cached_categories()
+    portfolio_items = PortfolioItem.query.limit(6).all()
+    # The page is shared by all visitors: the token is fetched by the browser
+    quick_request_form = QuickRequestForm(meta={'csrf': False})
+    quick_request_form.category_id.choices = category_choices()
+    return render_template('index.html', categories=categories[:3], portfolio_items=portfolio_items, quick_request_form=quick_request_form)
+
+@public_bp.route('/services')
+@page_cache.cached('category')
+def services():
+    categories = cached_categories()
+    return render_template('services.html', categories=categories)
+
+@public_bp.route('/portfolio')
+@page_cache.cached('portfolio_item', 'category', 'gallery', 'photo_tag', 'photo_tags')
+def portfolio():
+    per_page = 12  # Number of items per page
+    
+    # Get filters
+    category_id = request.args.get('category_id', type=int)
+    gallery_id = request.args.get('gallery_id', type=int)
+    tag_name = request.args.get('tag', type=str)
+    text_query = request.args.get('q', '', type=str).strip()
+    filter_args = {key: value for key, value in
+                   (('category_id', category_id), ('gallery_id', gallery_id), ('tag', tag_name), ('q', text_query))
+                   if value}
+    
+    # Build query with filters; the cards show each item's category, gallery and tags
+    query = portfolio_query(category_id, gallery_id, tag_name).options(db.joinedload(PortfolioItem.category),
+                                                                       db.joinedload(PortfolioItem.gallery))
+    
+    if text_query or request.args.get('mode') == 'pages':
+        # Numbered pages (OFFSET based): used for ranked search results and shallow browsing
+        page = request.args.get('page', 1, type=int)
+        if text_query:
+            query = search_portfolio(query, text_query)
+        else:
+            query = query.order_by(PortfolioItem.created_at.desc(), PortfolioItem.id.desc())
+        pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+        portfolio_items = pagination.items
+        keyset = None
+    else:
+        keyset = paginate_portfolio(query, per_page)
+        portfolio_items = keyset.items
+        pagination = None
+    categories = cached_categories()
+    galleries = cached_galleries()
+    tags = cached_tags()
+    
+    return render_template('portfolio.html', 
+                          portfolio_items=portfolio_items,
+                          pagination=pagination,
+                          keyset=keyset,
+                          filter_args=filter_args,
+                          categories=categories,
+                          galleries=galleries,
+                          tags=tags,
+                          current_category=category_id,
+                          current_gallery=gallery_id,
+                          current_tag=tag_name,
+                          current_query=text_query)
+
+@public_bp.route('/about')
+@page_cache.cached('review')
+def about():
+    reviews = Review.query.order_by(Review.date.desc()).limit(6).all()
+    return render_template('about.html', reviews=reviews)
+
+@public_bp.route('/contacts', methods=['GET', 'POST'])
+def contacts():
+    form = ContactForm()
+    if form.validate_on_submit():
+        accept_request(form.client_name.data, "", message=form.message.data)
+        flash('Спасибо за ваше сообщение! Мы свяжемся с вами в ближайшее время.', 'success')
+        return redirect(url_for('.contacts'))
+    return render_template('contacts.html', form=form)
+
+@public_bp.route('/submit_request', methods=['POST'])
+def submit_request():
+    form = QuickRequestForm()
+    form.category_id.choices = category_choices()
+    if form.validate_on_submit():
+        accept_request(form.client_name.data, form.phone.data, category_id=form.category_id.data)
+        flash('Ваша заявка успешно отправлена! Мы свяжемся с вами в ближайшее время.', 'success')
+        return redirect(url_for('.index'))
+    else:
+        flash('Пожалуйста, заполните все обязательные поля.', 'error')
+        return redirect(url_for('.index'))
@@ -0,0 +1,17 @@
+"""Forms of the public site."""
+from flask_wtf import FlaskForm
+from wtforms import StringField, TextAreaField, SelectField
+from wtforms.validators import DataRequired, Length
+
+class QuickRequestForm(FlaskForm):
+    client_name = StringField('Ваше имя', validators=[DataRequired(), Length(min=2, max=100)])
+    phone = StringField('Телефон', validators=[DataRequired(), Length(min=5, max=20)])
+    category_id = SelectField('Тематика', coerce=int, validators=[DataRequired()])
+
+class ContactForm(FlaskForm):
+    client_name = StringField('Ваше имя', validators=[DataRequired(), Length(min=2, max=100)])
+    message = TextAreaField('Сообщение', validators=[DataRequired()])
+
+class CommentForm(FlaskForm):
+    author_name = StringField('Ваше имя', validators=[DataRequired(), Length(max=100)])
+    text = TextAreaField('Комментарий', validators=[DataRequired(), Length(max=500)])
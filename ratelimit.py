@@ -0,0 +1,106 @@
+"""Rate-limit counters shared by every worker process on the host.
+
+Importing this module registers the ``sqlite`` storage scheme with the
+limits library, so Flask-Limiter can be pointed at it with a storage URI
+such as ``sqlite:////srv/photostudio/instance/ratelimit.db``. Each hit is a
+single upsert in autocommit mode, which SQLite applies atomically, and the
+file is opened in WAL mode without fsync: the counters are worth less than
+the latency of flushing them to disk. Supports the fixed-window strategy.
+"""
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import unquote, urlparse
+
+from limits.storage import Storage
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS rate_limit (
+    key TEXT PRIMARY KEY,
+    count INTEGER NOT NULL,
+    expiry REAL NOT NULL
+) WITHOUT ROWID
+'''
+
+# Start a new window when the stored one has expired, otherwise add to it
+INCREMENT = '''
+INSERT INTO rate_limit (key, count, expiry) VALUES (:key, :amount, :now + :expiry)
+ON CONFLICT (key) DO UPDATE SET
+    count = CASE WHEN expiry <= :now THEN excluded.count ELSE count + excluded.count END,
+    expiry = CASE WHEN expiry <= :now THEN excluded.expiry ELSE expiry END
+RETURNING count
+'''
+
+# Expired rows are removed every PURGE_INTERVAL increments of a process
+PURGE_INTERVAL = 1000
+
+
+class SQLiteStorage(Storage):
+    """limits storage keeping counters in a local SQLite file"""
+
+    STORAGE_SCHEME = ['sqlite']
+
+    def __init__(self, uri, wrap_exceptions=False, **options):
+        parsed = urlparse(uri)
+        self.path = unquote(parsed.netloc + parsed.path)
+        if not self.path:
+            raise ValueError('sqlite:// rate-limit storage needs a file path')
+        self.timeout = float(options.get('timeout', 5))
+        self._local = threading.local()
+        self._increments = 0
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def _connection(self):
+        # One connection per thread, reopened in processes forked after the first use
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None,
+                                         check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=OFF')
+            connection.execute(SCHEMA)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def incr(self, key, expiry, amount=1):
+        connection = self._connection()
+        now = time.time()
+        count = connection.execute(INCREMENT, {'key': key, 'amount': amount, 'now': now,
+                                               'expiry': expiry}).fetchone()[0]
+        self._increments += 1
+        if self._increments % PURGE_INTERVAL == 0:
+            connection.execute('DELETE FROM rate_limit WHERE expiry <= ?', (now,))
+        return count
+
+    def get(self, key):
+        row = self._connection().execute('SELECT count FROM rate_limit WHERE key = ? AND expiry > ?',
+                                         (key, time.time())).fetchone()
+        return row[0] if row else 0
+
+    def get_expiry(self, key):
+        now = time.time()
+        row = self._connection().execute('SELECT expiry FROM rate_limit WHERE key = ? AND expiry > ?',
+                                         (key, now)).fetchone()
+        return row[0] if row else now
+
+    def check(self):
+        try:
+            self._connection().execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self):
+        return self._connection().execute('DELETE FROM rate_limit').rowcount
+
+    def clear(self, key):
+        self._connection().execute('DELETE FROM rate_limit WHERE key = ?', (key,))
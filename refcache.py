@@ -0,0 +1,45 @@
+"""Process-local cache for small reference tables.
+
+Entries are stamped with the versions of the tables they were loaded from
+and are reloaded as soon as any of those tables is bumped in the shared
+VersionStore, so every worker process sees an admin edit on its next read.
+"""
+import threading
+
+
+class ReferenceCache:
+    """Loader results cached until one of their source tables changes"""
+
+    def __init__(self, versions, on_lookup=None):
+        self.versions = versions
+        self.on_lookup = on_lookup  # Called with (name, hit) after every get
+        self._loaders = {}
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, loader, tables):
+        """Cache loader() under name, invalidated by writes to any of tables"""
+        self._loaders[name] = (loader, tuple(tables))
+
+    def get(self, name):
+        loader, tables = self._loaders[name]
+        # Read the version before loading: a write racing with the load bumps it again afterwards
+        version = self.versions.versions(tables)
+        entry = self._entries.get(name)
+        if entry is not None and entry[0] == version:
+            if self.on_lookup is not None:
+                self.on_lookup(name, True)
+            return entry[1]
+        with self._lock:
+            entry = self._entries.get(name)
+            hit = entry is not None and entry[0] == version
+            if self.on_lookup is not None:
+                self.on_lookup(name, hit)
+            if hit:
+                return entry[1]
+            value = loader()
+            self._entries[name] = (version, value)
+            return value
+
+    def clear(self):
+        self._entries.clear()
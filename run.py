@@ -1,8 +1,6 @@
-from app import app, db, init_db
+from app import create_app
 
 if __name__ == '__main__':
-    # Initialize the database
-    init_db()
-    
-    # Run the app
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    # Initialize the database and run the development server
+    app = create_app(init_database=True)
+    app.run(debug=True, host='0.0.0.0', port=5000)
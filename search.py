@@ -0,0 +1,207 @@
+"""Full-text search over portfolio items using SQLite FTS5.
+
+Text is normalised and stemmed in Python before it is indexed, and query
+terms are stemmed the same way and matched as prefixes. The Snowball stemmer
+maps inflections of one word together ("свадьба" and "свадьбы" both index
+as "свадьб"), but not different words of one root: "свадебный" stems to
+"свадебн" and does not find photos that only say "свадьба". A short prefix
+such as "свад" matches both. On databases without FTS5 the index is
+disabled and callers fall back to LIKE matching.
+"""
+import re
+
+from sqlalchemy import bindparam, literal_column, select, table, text
+from sqlalchemy.exc import OperationalError
+
+TABLE = 'portfolio_search'
+
+# bm25() weights for the title, description and tags columns
+COLUMN_WEIGHTS = (10.0, 2.0, 5.0)
+
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+CYRILLIC = re.compile(r'[а-я]')
+
+# Snowball Russian stemmer (https://snowballstem.org/algorithms/russian/stemmer.html)
+VOWELS = 'аеиоуыэюя'
+PERFECTIVE_GERUND = (('в', 'вши', 'вшись'), ('ив', 'ивши', 'ившись', 'ыв', 'ывши', 'ывшись'))
+ADJECTIVE = ((), ('ее', 'ие', 'ые', 'ое', 'ими', 'ыми', 'ей', 'ий', 'ый', 'ой', 'ем', 'им', 'ым', 'ом',
+                  'его', 'ого', 'ему', 'ому', 'их', 'ых', 'ую', 'юю', 'ая', 'яя', 'ою', 'ею'))
+PARTICIPLE = (('ем', 'нн', 'вш', 'ющ', 'щ'), ('ивш', 'ывш', 'ующ'))
+REFLEXIVE = ((), ('ся', 'сь'))
+VERB = (('ла', 'на', 'ете', 'йте', 'ли', 'й', 'л', 'ем', 'н', 'ло', 'но', 'ет', 'ют', 'ны', 'ть', 'ешь', 'нно'),
+        ('ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'ей', 'уй', 'ил', 'ыл', 'им', 'ым', 'ен',
+         'ило', 'ыло', 'ено', 'ят', 'ует', 'уют', 'ит', 'ыт', 'ены', 'ить', 'ыть', 'ишь', 'ую', 'ю'))
+NOUN = ((), ('а', 'ев', 'ов', 'ие', 'ье', 'е', 'иями', 'ями', 'ами', 'еи', 'ии', 'и', 'ией', 'ей', 'ой', 'ий',
+             'й', 'иям', 'ям', 'ием', 'ем', 'ам', 'ом', 'о', 'у', 'ах', 'иях', 'ях', 'ы', 'ь', 'ию', 'ью', 'ю',
+             'ия', 'ья', 'я'))
+SUPERLATIVE = ((), ('ейше', 'ейш'))
+DERIVATIONAL = ((), ('ость', 'ост'))
+
+
+def _regions(word):
+    """Start offsets of the RV and R2 regions"""
+    rv = r1 = r2 = len(word)
+    for i, char in enumerate(word):
+        if char in VOWELS:
+            rv = i + 1
+            break
+    for i in range(1, len(word)):
+        if word[i - 1] in VOWELS and word[i] not in VOWELS:
+            r1 = i + 1
+            break
+    for i in range(r1 + 1, len(word)):
+        if word[i - 1] in VOWELS and word[i] not in VOWELS:
+            r2 = i + 1
+            break
+    return rv, r2
+
+
+def _strip(word, start, groups):
+    """Remove the longest ending from groups found after start; None if there is none.
+
+    Endings of the first group only count when preceded by 'а' or 'я'.
+    """
+    region = word[start:]
+    best = None
+    for index, endings in enumerate(groups):
+        for ending in endings:
+            if region.endswith(ending) and (best is None or len(ending) > len(best[1])):
+                best = (index, ending)
+    if best is None:
+        return None
+    index, ending = best
+    stem = word[:len(word) - len(ending)]
+    if index == 0 and not (len(stem) > start and stem[-1] in 'ая'):
+        return None
+    return stem
+
+
+def stem(word):
+    """Reduce a lower-case Russian word to its Snowball stem"""
+    if not CYRILLIC.search(word):
+        return word
+    rv, r2 = _regions(word)
+
+    # Step 1
+    stripped = _strip(word, rv, PERFECTIVE_GERUND)
+    if stripped is not None:
+        word = stripped
+    else:
+        word = _strip(word, rv, REFLEXIVE) or word
+        stripped = _strip(word, rv, ADJECTIVE)
+        if stripped is not None:
+            word = _strip(stripped, rv, PARTICIPLE) or stripped
+        else:
+            word = _strip(word, rv, VERB) or _strip(word, rv, NOUN) or word
+
+    # Step 2
+    if word.endswith('и') and len(word) > rv:
+        word = word[:-1]
+
+    # Step 3
+    word = _strip(word, r2, DERIVATIONAL) or word
+
+    # Step 4
+    if word.endswith('нн') and len(word) - 1 > rv:
+        word = word[:-1]
+    else:
+        stripped = _strip(word, rv, SUPERLATIVE)
+        if stripped is not None:
+            word = stripped[:-1] if stripped.endswith('нн') else stripped
+        elif word.endswith('ь') and len(word) > rv:
+            word = word[:-1]
+    return word
+
+
+def tokens(value):
+    """Lower-case word tokens of value, with 'ё' folded into 'е'"""
+    return TOKEN_PATTERN.findall((value or '').lower().replace('ё', 'е'))
+
+
+def normalize(value):
+    """Indexed form of a text: its stemmed tokens"""
+    return ' '.join(stem(token) for token in tokens(value))
+
+
+def match_expression(query):
+    """FTS5 MATCH expression requiring every query word as a stem prefix"""
+    return ' '.join(f'"{stem(token)}"*' for token in tokens(query))
+
+
+class SearchIndex:
+    """FTS5 table keyed by portfolio item id"""
+
+    def __init__(self):
+        self.available = None
+
+    def ensure(self, session):
+        """Create the index if needed; return True if it was just created"""
+        if session.get_bind().dialect.name != 'sqlite':
+            self.available = False
+            return False
+        exists = session.execute(text("SELECT 1 FROM sqlite_master WHERE name = :name"),
+                                 {'name': TABLE}).first()
+        if exists:
+            self.available = True
+            return False
+        try:
+            session.execute(text(
+                f"CREATE VIRTUAL TABLE {TABLE} USING fts5("
+                "title, description, tags, tokenize='unicode61 remove_diacritics 2', prefix='2 3')"))
+        except OperationalError:
+            # SQLite built without FTS5
+            self.available = False
+            return False
+        self.available = True
+        return True
+
+    def _ready(self, session):
+        if self.available is None:
+            self.ensure(session)
+        return self.available
+
+    def update(self, session, item_id, title, description, tag_names):
+        """(Re)index one item inside the caller's transaction"""
+        if not self._ready(session):
+            return
+        session.execute(text(f'DELETE FROM {TABLE} WHERE rowid = :id'), {'id': item_id})
+        session.execute(
+            text(f'INSERT INTO {TABLE} (rowid, title, description, tags) VALUES (:id, :title, :description, :tags)'),
+            {'id': item_id, 'title': normalize(title), 'description': normalize(description),
+             'tags': normalize(' '.join(tag_names))})
+
+    def add(self, session, rows):
+        """Index new items, given as (id, title, description, tag names), with one executemany"""
+        if not self._ready(session) or not rows:
+            return
+        session.execute(
+            text(f'INSERT INTO {TABLE} (rowid, title, description, tags) VALUES (:id, :title, :description, :tags)'),
+            [{'id': item_id, 'title': normalize(title), 'description': normalize(description),
+              'tags': normalize(' '.join(tag_names))} for item_id, title, description, tag_names in rows])
+
+    def remove(self, session, item_ids):
+        """Drop items from the index inside the caller's transaction"""
+        if not self._ready(session) or not item_ids:
+            return
+        session.execute(text(f'DELETE FROM {TABLE} WHERE rowid IN :ids').bindparams(
+            bindparam('ids', expanding=True)), {'ids': list(item_ids)})
+
+    def rebuild(self, session, rows):
+        """Replace the whole index with rows of (id, title, description, tag names)"""
+        if not self._ready(session):
+            return
+        session.execute(text(f'DELETE FROM {TABLE}'))
+        for item_id, title, description, tag_names in rows:
+            self.update(session, item_id, title, description, tag_names)
+
+    def matches(self, session, query):
+        """Subquery of (item_id, rank) matching query, best first by bm25; None if unavailable"""
+        expression = match_expression(query)
+        if not expression or not self._ready(session):
+            return None
+        weights = ', '.join(str(weight) for weight in COLUMN_WEIGHTS)
+        return (select(literal_column('rowid').label('item_id'),
+                       literal_column(f'bm25({TABLE}, {weights})').label('rank'))
+                .select_from(table(TABLE))
+                .where(literal_column(TABLE).op('MATCH')(expression))
+                .subquery())
@@ -0,0 +1,94 @@
+"""Synthetic data for load tests, added by `flask seed` and the benchmarks."""
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, select
+
+from app import db
+from models import (Category, Comment, Gallery, PortfolioItem, Rating, Request, dialect_insert, photo_tags,
+                    recount_ratings, recount_stats, search_index)
+from portfolio import resolve_tags
+
+SEED_WORDS = ('портрет', 'свадьба', 'закат', 'семья', 'студия', 'улыбка', 'осень', 'город', 'море', 'букет',
+              'невеста', 'дети', 'прогулка', 'свет', 'лес', 'зима', 'праздник', 'пара', 'товар', 'интерьер')
+SEED_NAMES = ('Анна', 'Иван', 'Мария', 'Ольга', 'Дмитрий', 'Елена', 'Сергей', 'Наталья', 'Алексей', 'Ирина')
+SEED_BATCH_SIZE = 10000  # Rows per INSERT executemany and per commit
+
+def seed_database(photos=0, tags_per_photo=2, comments=0, ratings=0, requests=0, days=365, seed=0):
+    """Add generated portfolio items, tag links, comments, ratings and requests with bulk inserts.
+
+    Rows are spread over the existing categories and galleries and over the
+    last days days; the same seed generates the same rows. Comments and
+    ratings go to every portfolio item, old and new. Aggregates, dashboard
+    counters and the search index are brought up to date. Returns the
+    number of rows added per table.
+    """
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    category_ids = db.session.scalars(select(Category.id)).all()
+    if not category_ids:
+        raise ValueError('There are no categories; run init_db first')
+    gallery_ids = [None] + db.session.scalars(select(Gallery.id)).all()
+    tag_names = {tag_id: name for name, tag_id in resolve_tags(list(SEED_WORDS)).items()}
+    
+    def moment():
+        return now - timedelta(seconds=rng.randrange(days * 24 * 3600))
+    
+    def words(count):
+        return ' '.join(rng.choice(SEED_WORDS) for _ in range(count))
+    
+    def batches(total):
+        for start in range(0, total, SEED_BATCH_SIZE):
+            yield range(start, min(start + SEED_BATCH_SIZE, total))
+    
+    added = {'portfolio_item': 0, 'photo_tags': 0, 'comment': 0, 'rating': 0, 'request': 0}
+    for batch in batches(photos):
+        rows = [{'title': words(3).capitalize(), 'description': words(12), 'category_id': rng.choice(category_ids),
+                 'gallery_id': rng.choice(gallery_ids), 'image_filename': f'seed-{n % 100}.jpg',
+                 'processing_status': 'ready', 'created_at': moment(), 'rating_count': 0, 'rating_sum': 0}
+                for n in batch]
+        ids = db.session.scalars(insert(PortfolioItem).returning(PortfolioItem.id, sort_by_parameter_order=True),
+                                 rows).all()
+        item_tags = [rng.sample(list(tag_names), min(tags_per_photo, len(tag_names))) for _ in ids]
+        links = [{'photo_id': item_id, 'tag_id': tag_id} for item_id, tags in zip(ids, item_tags) for tag_id in tags]
+        if links:
+            db.session.execute(insert(photo_tags), links)
+        search_index.add(db.session, [(item_id, row['title'], row['description'], [tag_names[t] for t in tags])
+                                      for item_id, row, tags in zip(ids, rows, item_tags)])
+        db.session.commit()
+        added['portfolio_item'] += len(ids)
+        added['photo_tags'] += len(links)
+    
+    item_ids = db.session.scalars(select(PortfolioItem.id)).all()
+    if item_ids:
+        for batch in batches(comments):
+            db.session.execute(insert(Comment), [
+                {'author_name': rng.choice(SEED_NAMES), 'text': words(8), 'created_at': moment(),
+                 'portfolio_item_id': rng.choice(item_ids)} for _ in batch])
+            db.session.commit()
+            added['comment'] += len(batch)
+        # Every item gets one rating from a visitor before any gets a second, so (item, ip) stays unique
+        visitor = rng.randrange(1 << 24)
+        existing_ratings = db.session.scalar(select(func.count(Rating.id)))
+        for batch in batches(ratings):
+            stmt = dialect_insert(Rating).on_conflict_do_nothing(index_elements=['portfolio_item_id', 'user_ip'])
+            db.session.execute(stmt, [
+                {'score': rng.choice((3, 4, 4, 5, 5, 5)), 'portfolio_item_id': item_ids[n % len(item_ids)],
+                 'user_ip': '10.{}.{}.{}'.format(*((visitor + n // len(item_ids)) % (1 << 24)).to_bytes(3, 'big'))}
+                for n in batch])
+            db.session.commit()
+        # Ratings a previous run already added are skipped
+        added['rating'] = db.session.scalar(select(func.count(Rating.id))) - existing_ratings
+    
+    for batch in batches(requests):
+        db.session.execute(insert(Request), [
+            {'client_name': rng.choice(SEED_NAMES), 'phone': f'+7{rng.randrange(10 ** 10):010d}',
+             'category_id': rng.choice(category_ids + [None]), 'message': words(6), 'created_at': moment()}
+            for _ in batch])
+        db.session.commit()
+        added['request'] += len(batch)
+    
+    recount_ratings()
+    recount_stats()
+    db.session.commit()
+    return added
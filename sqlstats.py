@@ -0,0 +1,132 @@
+"""Per-request SQL statistics and N+1 detection.
+
+instrument(engine) times every statement the engine executes and adds it
+to the QueryRecorder of the current context, if there is one; the
+application starts a recorder when a request begins and files it under
+the request's endpoint in a RouteStats when the request ends. Statements
+are grouped by shape: literals and bound parameters replaced by '?', IN
+lists collapsed. A SELECT shape run many times in one request is the
+signature of a lazy load per row (N+1).
+"""
+import re
+import threading
+import time
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+_current = ContextVar('query_recorder', default=None)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PARAMETER = re.compile(r'%\(\w+\)s|:\w+|\$\d+|%s|\?')
+_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_SPACE = re.compile(r'\s+')
+
+
+def statement_shape(statement):
+    """statement with its values replaced by '?', so repeated lookups compare equal"""
+    shape = _STRING.sub('?', statement)
+    shape = _PARAMETER.sub('?', shape)
+    shape = _NUMBER.sub('?', shape)
+    shape = _LIST.sub('(?)', shape)
+    return _SPACE.sub(' ', shape).strip()
+
+
+class QueryRecorder:
+    """Statements executed while it is the current recorder"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = {}  # statement -> [count, seconds]
+
+    def add(self, statement, duration):
+        self.count += 1
+        self.duration += duration
+        entry = self.shapes.get(statement)
+        if entry is None:
+            self.shapes[statement] = [1, duration]
+        else:
+            entry[0] += 1
+            entry[1] += duration
+
+    def repeated(self, threshold):
+        """(shape, count, seconds) of SELECT shapes run at least threshold times, most frequent first"""
+        found = [(statement_shape(statement), count, seconds)
+                 for statement, (count, seconds) in self.shapes.items()
+                 if count >= threshold and statement.lstrip()[:6].upper() == 'SELECT']
+        return sorted(found, key=lambda entry: -entry[1])
+
+
+def start_recording():
+    """Make a new recorder current for this context; stop it with stop_recording(recorder)"""
+    recorder = QueryRecorder()
+    recorder._token = _current.set(recorder)
+    return recorder
+
+
+def stop_recording(recorder):
+    _current.reset(recorder._token)
+
+
+def instrument(engine):
+    """Time the statements of engine into the current recorder"""
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if _current.get() is not None:
+            conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        recorder = _current.get()
+        started = conn.info.get('query_started')
+        if recorder is not None and started:
+            recorder.add(statement, time.perf_counter() - started.pop())
+
+
+class RouteStats:
+    """Query statistics per endpoint, accumulated in this process"""
+
+    def __init__(self, n_plus_one_threshold=10):
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def record(self, endpoint, recorder, duration):
+        """File a finished request; returns the N+1 suspects not seen on endpoint before"""
+        suspects = recorder.repeated(self.n_plus_one_threshold)
+        with self._lock:
+            route = self._routes.get(endpoint)
+            if route is None:
+                route = self._routes[endpoint] = {
+                    'endpoint': endpoint, 'requests': 0, 'queries': 0, 'max_queries': 0,
+                    'db_time': 0.0, 'max_db_time': 0.0, 'time': 0.0, 'n_plus_one': 0, 'suspects': {}}
+            route['requests'] += 1
+            route['queries'] += recorder.count
+            route['max_queries'] = max(route['max_queries'], recorder.count)
+            route['db_time'] += recorder.duration
+            route['max_db_time'] = max(route['max_db_time'], recorder.duration)
+            route['time'] += duration
+            new = [suspect for suspect in suspects if suspect[0] not in route['suspects']]
+            if suspects:
+                route['n_plus_one'] += 1
+                for shape, count, _ in suspects:
+                    route['suspects'][shape] = max(route['suspects'].get(shape, 0), count)
+        return new
+
+    def worst(self, limit=20, key='db_time'):
+        """Routes ordered by key (a total such as 'db_time' or 'queries'), with per-request averages"""
+        with self._lock:
+            routes = [dict(route, suspects=sorted(route['suspects'].items(), key=lambda item: -item[1]))
+                      for route in self._routes.values()]
+        for route in routes:
+            route['avg_queries'] = route['queries'] / route['requests']
+            route['avg_db_time'] = route['db_time'] / route['requests']
+            route['avg_time'] = route['time'] / route['requests']
+        return sorted(routes, key=lambda route: -route[key])[:limit]
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
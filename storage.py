@@ -0,0 +1,128 @@
+"""Content-addressed storage for uploaded files.
+
+Files are stored under a sharded SHA-256 path such as
+``3f/a9/3fa9…e1.jpg``: identical uploads share one file, and a stored
+file never changes, so it can be cached forever.
+"""
+import errno
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+
+CHUNK_SIZE = 64 * 1024
+
+# Stored blobs and the derivatives generated from them
+BLOB_PATTERN = re.compile(r'^[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(_\d+w)?\.[a-z0-9]+$')
+EXTENSION_PATTERN = re.compile(r'^\.[a-z0-9]{1,10}$')
+
+
+def blob_name(digest, extension):
+    return f'{digest[:2]}/{digest[2:4]}/{digest}{extension}'
+
+
+def is_blob_name(name):
+    return bool(BLOB_PATTERN.match(name))
+
+
+def upload_extension(filename):
+    """Normalised extension of a client-supplied file name"""
+    # Not secure_filename(): it drops non-ASCII stems such as 'свадьба.jpg' down to 'jpg'
+    extension = os.path.splitext(os.path.basename((filename or '').replace('\\', '/')))[1].lower()
+    if not EXTENSION_PATTERN.match(extension):
+        return ''
+    return '.jpg' if extension == '.jpeg' else extension
+
+
+def _move(src, dst):
+    try:
+        os.replace(src, dst)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        shutil.move(src, dst)
+
+
+def _commit_blob(tmp_path, digest, extension, upload_dir):
+    """Move a fully written temporary file to its content address"""
+    name = blob_name(digest, extension)
+    path = os.path.join(upload_dir, name)
+    if os.path.exists(path):
+        try:
+            # Same content is already stored; a fresh mtime keeps the sweeper off it
+            os.utime(path)
+            os.remove(tmp_path)
+            return name
+        except FileNotFoundError:
+            pass  # Swept in the meantime: store it again
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        _move(tmp_path, path)
+    except FileNotFoundError:
+        # A concurrent remove_blob pruned the shard directory: recreate it once
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _move(tmp_path, path)
+    return name
+
+
+def save_stream(stream, filename, upload_dir, tmp_dir):
+    """Stream a file object to disk while hashing it.
+
+    Returns the stored name (relative to upload_dir) and the number of
+    bytes written.
+    """
+    os.makedirs(tmp_dir, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return _commit_blob(tmp_path, digest.hexdigest(), upload_extension(filename), upload_dir), size
+
+
+def store_file(path, upload_dir, extension):
+    """Move an existing file (e.g. a recompressed original) into storage"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return _commit_blob(path, digest.hexdigest(), extension, upload_dir)
+
+
+def remove_blob(name, upload_dir):
+    """Delete a stored file and prune the shard directories it leaves empty"""
+    path = os.path.join(upload_dir, name)
+    if os.path.exists(path):
+        os.remove(path)
+    directory = os.path.dirname(path)
+    while os.path.normpath(directory) != os.path.normpath(upload_dir):
+        try:
+            os.rmdir(directory)
+        except OSError:
+            break
+        directory = os.path.dirname(directory)
+
+
+def iter_stored_files(upload_dir):
+    """Yield (name, mtime) for every file under upload_dir, names relative to it"""
+    for root, dirs, files in os.walk(upload_dir):
+        for filename in files:
+            if filename.startswith('.'):
+                continue
+            path = os.path.join(root, filename)
+            try:
+                mtime = os.stat(path).st_mtime
+            except FileNotFoundError:
+                continue
+            yield os.path.relpath(path, upload_dir).replace(os.sep, '/'), mtime
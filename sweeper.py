@@ -0,0 +1,114 @@
+"""Deferred deletion of uploaded files.
+
+Requests never delete files themselves: after committing, they write a
+tombstone naming the files that may have become unused, and a background
+sweeper deletes them once it has checked that nothing references them
+any more. Tombstones are plain files, so they survive restarts and are
+shared by every process on the host; a lock file makes sure only one
+process sweeps at a time.
+"""
+import logging
+import os
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single process is assumed
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class TombstoneQueue:
+    """Directory of tombstone files, each holding groups of file names.
+
+    A group is a stored upload followed by the derivatives generated from
+    it; the whole group is deleted together.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def push(self, groups):
+        groups = [group for group in groups if group and group[0]]
+        if not groups:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.part')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(''.join('\t'.join(group) + '\n' for group in groups))
+        os.replace(tmp_path, tmp_path[:-len('.part')] + '.tomb')
+
+    def drain(self, handle):
+        """Pass the groups of every tombstone to handle and delete the tombstone.
+
+        handle returns the groups that could not be processed yet; they are
+        queued again. Returns the number of tombstones processed.
+        """
+        try:
+            names = sorted(name for name in os.listdir(self.directory) if name.endswith('.tomb'))
+        except FileNotFoundError:
+            return 0
+        for name in names:
+            path = os.path.join(self.directory, name)
+            with open(path, encoding='utf-8') as f:
+                groups = [line.rstrip('\n').split('\t') for line in f if line.strip()]
+            self.push(handle(groups))
+            os.remove(path)
+        return len(names)
+
+
+class Sweeper:
+    """Run sweep() from a background thread every interval seconds, or when woken.
+
+    With interval <= 0 there is no thread and wake() sweeps inline.
+    """
+
+    def __init__(self, sweep, lock_path, interval=60.0):
+        self.sweep = sweep
+        self.lock_path = lock_path
+        self.interval = interval
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._sweep_lock = threading.Lock()
+        self._pid = None
+
+    def start(self):
+        if self.interval <= 0 or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._wakeup = threading.Event()
+            threading.Thread(target=self._loop, name='upload-sweeper', daemon=True).start()
+
+    def wake(self):
+        if self.interval <= 0:
+            self.run_once()
+            return
+        self.start()
+        self._wakeup.set()
+
+    def run_once(self, **kwargs):
+        """Sweep now unless another process is sweeping; returns False if it was"""
+        os.makedirs(os.path.dirname(self.lock_path), exist_ok=True)
+        with open(self.lock_path, 'a') as lock_file:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return False
+            with self._sweep_lock:
+                self.sweep(**kwargs)
+        return True
+
+    def _loop(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception('Upload sweep failed')
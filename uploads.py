@@ -0,0 +1,261 @@
+"""Uploaded images: storage, derivative jobs and deletion once unused.
+
+Uploads are content-addressed blobs (see storage.py) that rows reference
+by name. New uploads queue an ImageJob that a background process pool
+turns into responsive derivatives; files no row uses any more are
+tombstoned and deleted by the upload sweeper.
+"""
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+from flask import url_for
+from sqlalchemy import select
+
+from app import app, db
+from jobs import JobRunner
+from models import Category, ImageJob, PortfolioItem
+from storage import save_stream, store_file, remove_blob, iter_stored_files
+from sweeper import TombstoneQueue, Sweeper
+
+upload_hooks = []  # Called with the size of every stored upload; web.py counts them
+
+def upload_dir():
+    return os.path.join(app.root_path, app.config['UPLOAD_FOLDER'])
+
+def upload_path(filename):
+    return os.path.join(upload_dir(), filename)
+
+def store_stream(stream, filename):
+    """Save a file to content-addressed storage and return its name"""
+    name, size = save_stream(stream, filename, upload_dir(), app.config['UPLOAD_TMP_FOLDER'])
+    for hook in upload_hooks:
+        hook(size)
+    return name
+
+def store_upload(file_storage):
+    """Save an uploaded file to content-addressed storage and return its name"""
+    return store_stream(file_storage.stream, file_storage.filename)
+
+def upload_references(filename):
+    """Portfolio items and categories that use a stored file"""
+    return (PortfolioItem.query.filter_by(image_filename=filename).all()
+            + Category.query.filter_by(image_filename=filename).all())
+
+def upload_files(obj):
+    """Snapshot of the files obj uses, to release once it stops using them"""
+    return (obj.image_filename, obj.image_variants)
+
+def release_uploads(files):
+    """Queue (filename, variants) pairs for deletion once no row references them.
+
+    Call after the commit that removed or replaced the references; the
+    upload sweeper deletes the files in the background.
+    """
+    from images import derivative_files
+    groups = [[filename] + derivative_files(json.loads(variants) if variants else None)
+              for filename, variants in files if filename]
+    if groups:
+        tombstones.push(groups)
+        upload_sweeper.wake()
+
+def referenced_uploads(filenames):
+    """The subset of filenames still used by a portfolio item or category"""
+    referenced = set()
+    for model in (PortfolioItem, Category):
+        referenced.update(db.session.scalars(select(model.image_filename)
+                                             .where(model.image_filename.in_(filenames))))
+    return referenced
+
+def remove_released_uploads(groups):
+    """Delete tombstoned file groups whose upload is unused; returns the groups to retry later"""
+    referenced = referenced_uploads({group[0] for group in groups})
+    cutoff = time.time() - app.config['UPLOAD_SWEEP_GRACE']
+    retry = []
+    for group in groups:
+        filename = group[0]
+        if filename in referenced:
+            continue
+        try:
+            if os.stat(upload_path(filename)).st_mtime > cutoff:
+                # Just stored again by an upload that may not have committed yet
+                retry.append(group)
+                continue
+        except FileNotFoundError:
+            pass
+        for name in group:
+            remove_blob(name, upload_dir())
+    return retry
+
+def reclaim_orphan_uploads():
+    """Delete files in the upload folder that no row references; returns how many were removed"""
+    from images import derivative_files
+    referenced = set()
+    for model in (PortfolioItem, Category):
+        for filename, variants in db.session.execute(select(model.image_filename, model.image_variants)):
+            referenced.add(filename)
+            if variants:
+                referenced.update(derivative_files(json.loads(variants)))
+    # Uploads and derivatives of requests or jobs still in flight are younger than the grace period
+    cutoff = time.time() - max(app.config['UPLOAD_SWEEP_GRACE'], app.config['IMAGE_JOB_LEASE'])
+    removed = 0
+    for name, mtime in list(iter_stored_files(upload_dir())):
+        if name not in referenced and mtime < cutoff:
+            remove_blob(name, upload_dir())
+            removed += 1
+    return removed
+
+def sweep_uploads(orphans=None):
+    """Drain the tombstone queue; also scan for orphans when asked or when a scan is due"""
+    with app.app_context():
+        tombstones.drain(remove_released_uploads)
+        stamp = os.path.join(app.config['TOMBSTONE_FOLDER'], 'orphan-scan')
+        if orphans is None:
+            try:
+                orphans = time.time() - os.stat(stamp).st_mtime > app.config['ORPHAN_SCAN_INTERVAL']
+            except FileNotFoundError:
+                orphans = True
+        if orphans:
+            removed = reclaim_orphan_uploads()
+            if removed:
+                app.logger.info('Reclaimed %s orphaned upload files', removed)
+            os.makedirs(os.path.dirname(stamp), exist_ok=True)
+            with open(stamp, 'w'):
+                pass
+
+tombstones = TombstoneQueue(app.config['TOMBSTONE_FOLDER'])
+upload_sweeper = Sweeper(sweep_uploads, os.path.join(app.config['TOMBSTONE_FOLDER'], 'sweep.lock'),
+                         interval=app.config['UPLOAD_SWEEP_INTERVAL'])
+
+# Derivative jobs
+IMAGE_JOB_TARGETS = {'portfolio_item': PortfolioItem, 'category': Category}
+
+def queue_image_processing(obj):
+    """Mark obj's upload as pending and queue derivative generation for it.
+
+    If the same file was already processed for another row its results are
+    reused. Otherwise the job is committed together with obj; call
+    image_jobs.wake() after the commit so the background workers pick it up.
+    """
+    db.session.flush()  # Make sure obj has an id
+    for ref in upload_references(obj.image_filename):
+        if ref is not obj and ref.processing_status == 'ready' and ref.image_variants:
+            obj.image_variants = ref.image_variants
+            obj.image_meta = ref.image_meta
+            obj.processing_status = 'ready'
+            return
+
+    obj.image_variants = None
+    obj.image_meta = None
+    obj.processing_status = 'pending'
+    db.session.add(ImageJob(target_type=obj.__tablename__, target_id=obj.id,
+                            image_filename=obj.image_filename))
+
+def claim_image_jobs(limit):
+    """Atomically mark up to limit queued (or abandoned) jobs as running"""
+    with app.app_context():
+        claimed = []
+        while len(claimed) < limit:
+            now = datetime.utcnow()
+            stale = now - timedelta(seconds=app.config['IMAGE_JOB_LEASE'])
+            candidates = ImageJob.query.filter(
+                db.or_(ImageJob.status == 'queued',
+                       db.and_(ImageJob.status == 'running', ImageJob.updated_at < stale))
+            ).order_by(ImageJob.id).limit(limit - len(claimed)).all()
+            if not candidates:
+                break
+
+            for job in candidates:
+                # Another process may have claimed the same row in the meantime
+                updated = ImageJob.query.filter_by(id=job.id, status=job.status, attempts=job.attempts).update(
+                    {'status': 'running', 'attempts': job.attempts + 1, 'updated_at': now},
+                    synchronize_session=False)
+                if not updated:
+                    continue
+                if not any(ref.processing_status == 'pending' for ref in upload_references(job.image_filename)):
+                    # Superseded: the rows were deleted, re-uploaded or processed by another job
+                    job.status = 'done'
+                    job.updated_at = now
+                else:
+                    stem, extension = os.path.splitext(job.image_filename)
+                    scratch_path = os.path.join(app.config['UPLOAD_TMP_FOLDER'], f'image-job-{job.id}{extension}')
+                    claimed.append((job.id, (upload_path(job.image_filename), upload_dir(), stem, scratch_path)))
+            db.session.commit()
+        return claimed
+
+def complete_image_job(job_id, result):
+    """Store a finished job's derivatives and metadata on every row using the file"""
+    with app.app_context():
+        job = db.session.get(ImageJob, job_id)
+        filename = job.image_filename
+        refs = upload_references(filename)
+
+        if result['recompressed']:
+            # The smaller original is a new blob; the uploaded one is released below
+            filename = store_file(result['recompressed'], upload_dir(), os.path.splitext(filename)[1])
+
+        variants = json.dumps(result['variants'])
+        for ref in refs:
+            ref.image_filename = filename
+            ref.image_variants = variants
+            ref.image_meta = json.dumps(result['meta'])
+            ref.processing_status = 'ready'
+        job.status = 'done'
+        job.error = None
+        job.updated_at = datetime.utcnow()
+        db.session.commit()
+
+        # Drop files nobody ended up using, e.g. when the rows were deleted meanwhile
+        release_uploads([(job.image_filename, None), (filename, variants)])
+
+def fail_image_job(job_id, error):
+    """Retry a failed job, giving up after IMAGE_JOB_ATTEMPTS"""
+    with app.app_context():
+        job = db.session.get(ImageJob, job_id)
+        job.error = error
+        job.updated_at = datetime.utcnow()
+        if job.attempts < app.config['IMAGE_JOB_ATTEMPTS']:
+            job.status = 'queued'
+        else:
+            job.status = 'failed'
+            app.logger.error('Image job %s failed: %s', job_id, error)
+            for ref in upload_references(job.image_filename):
+                if ref.processing_status == 'pending':
+                    # Public pages keep serving the original upload
+                    ref.processing_status = 'failed'
+        db.session.commit()
+
+# Pillow is only imported by the processes that run image jobs
+image_jobs = JobRunner(claim_image_jobs, 'images:process_image', complete_image_job, fail_image_job,
+                       workers=app.config['IMAGE_WORKERS'])
+
+# URLs, also template globals (see web.py)
+def upload_url(filename):
+    return url_for('static', filename='uploads/' + filename)
+
+def image_sources(obj):
+    """Return srcset strings per format for obj's derivatives, or None if there are none"""
+    if not obj.image_variants:
+        return None
+    variants = json.loads(obj.image_variants)
+    sizes = variants['sizes']
+    sources = {}
+    for fmt in sizes[0]['files']:
+        sources[fmt] = ', '.join(f"{upload_url(size['files'][fmt])} {size['width']}w" for size in sizes)
+    # The middle derivative is a sensible default for browsers without srcset support
+    fallback = sizes[len(sizes) // 2]
+    sources['src'] = upload_url(fallback['files']['jpeg'])
+    sources['width'] = fallback['width']
+    sources['height'] = fallback['height']
+    return sources
+
+def image_url(obj, size='full'):
+    """URL of the named JPEG derivative, falling back to the original upload"""
+    if obj.image_variants:
+        sizes = json.loads(obj.image_variants)['sizes']
+        for variant in sizes:
+            if variant['name'] == size:
+                return upload_url(variant['files']['jpeg'])
+        return upload_url(sizes[-1]['files']['jpeg'])
+    return upload_url(obj.image_filename)
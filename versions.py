@@ -0,0 +1,36 @@
+"""Change counters shared by every process of the application.
+
+Each counter is a file in a shared directory; bumping it appends one byte,
+so its version is simply the file size. Reading a version costs a single
+stat() call, which makes it cheap enough to check on every request.
+"""
+import os
+
+
+class VersionStore:
+    """Named, monotonically increasing counters stored as files in directory"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def version(self, name):
+        try:
+            return os.stat(self._path(name)).st_size
+        except FileNotFoundError:
+            return 0
+
+    def versions(self, names):
+        return tuple(self.version(name) for name in names)
+
+    def bump(self, names):
+        """Advance every named counter; appends are atomic across processes"""
+        os.makedirs(self.directory, exist_ok=True)
+        for name in names:
+            fd = os.open(self._path(name), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, b'.')
+            finally:
+                os.close(fd)
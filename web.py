@@ -0,0 +1,310 @@
+"""The web side of the application: extensions, caches, metrics and request hooks.
+
+Imported by create_app() and the blueprints only, so CLI commands,
+init_db.py and the image workers never build the page cache, the
+metrics registry or the rate limiter.
+"""
+import mimetypes
+import os
+import random
+import threading
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+from flask import (before_render_template, g, request, request_started, send_from_directory, session,
+                   template_rendered)
+from flask_limiter import Limiter
+from flask_limiter.util import get_remote_address
+from flask_wtf.csrf import CSRFProtect
+from sqlalchemy import inspect, select
+from sqlalchemy.orm import Session
+
+from app import app, db
+from assets import SOURCES as ASSET_SOURCES, AssetManifest
+from client_requests import request_writer
+from metrics import MetricsRegistry
+from models import Category, Gallery, PhotoTag, commit_hooks, table_versions
+from pagecache import PageCache, MemoryBackend, DiskBackend, source_build
+from passwords import PasswordHasher
+from refcache import ReferenceCache
+from sqlstats import RouteStats, instrument, start_recording, stop_recording
+from storage import is_blob_name
+from uploads import image_jobs, image_sources, image_url, upload_hooks, upload_sweeper
+import ratelimit  # Registers the sqlite:// rate-limit storage
+
+csrf = CSRFProtect(app)
+with app.app_context():
+    # Statements are only timed while a request has a recorder (SQL_STATS or a profiled request)
+    instrument(db.engine)
+
+# Prometheus metrics of every worker process, served by monitoring.py at /metrics
+metrics = MetricsRegistry(app.config['METRICS_FOLDER'], 'photostudio',
+                          flush_interval=app.config['METRICS_FLUSH_INTERVAL'])
+http_requests = metrics.counter('http_requests_total', 'HTTP requests by endpoint, method and status.',
+                                ['endpoint', 'method', 'status'])
+http_latency = metrics.histogram('http_request_duration_seconds', 'Time to produce a response, by endpoint.',
+                                 ['endpoint'])
+db_queries = metrics.counter('db_queries_total', 'SQL statements run by requests, by endpoint.', ['endpoint'])
+db_query_time = metrics.counter('db_query_seconds_total', 'Time requests spent in SQL statements, by endpoint.',
+                                ['endpoint'])
+rate_limited = metrics.counter('rate_limited_total', 'Requests refused by the rate limiter, by endpoint and limit.',
+                               ['endpoint', 'limit'])
+stored_uploads = metrics.counter('uploads_total', 'Uploaded files stored.')
+upload_bytes = metrics.counter('upload_bytes_total', 'Bytes of uploaded files stored.')
+page_cache_lookups = metrics.counter('page_cache_lookups_total', 'Page cache lookups by endpoint and result.',
+                                     ['endpoint', 'result'])
+reference_cache_lookups = metrics.counter('reference_cache_lookups_total',
+                                          'Reference data cache lookups by name and result.', ['name', 'result'])
+
+def count_upload(size):
+    stored_uploads.inc()
+    upload_bytes.inc(amount=size)
+
+upload_hooks.append(count_upload)
+
+def db_pool_connections():
+    with app.app_context():
+        pool = db.engine.pool
+    if not hasattr(pool, 'checkedout'):
+        return {}
+    return {('size',): pool.size(), ('checked_out',): pool.checkedout(), ('idle',): pool.checkedin(),
+            ('overflow',): max(pool.overflow(), 0)}
+
+metrics.gauge('db_pool_connections', 'Connections of the process pool by state.', db_pool_connections, ['state'])
+
+def count_rate_limited(request_limit):
+    rate_limited.inc(request.endpoint or '', str(request_limit.limit))
+
+limiter = Limiter(
+    key_func=get_remote_address,
+    default_limits=["200 per day", "50 per hour"],
+    storage_uri=app.config['RATELIMIT_STORAGE_URI'],
+    on_breach=count_rate_limited
+)
+limiter.init_app(app)
+
+# Password checks run on a bounded pool so a login burst can't occupy every request thread
+password_hasher = PasswordHasher(app.config['PASSWORD_HASH_METHOD'], workers=app.config['PASSWORD_WORKERS'],
+                                 max_pending=app.config['PASSWORD_QUEUE_LIMIT'])
+
+def page_cache_backend():
+    if app.config['PAGE_CACHE_BACKEND'] == 'memory':
+        return MemoryBackend()
+    if app.config['PAGE_CACHE_BACKEND'] == 'disk':
+        return DiskBackend(app.config['PAGE_CACHE_FOLDER'])
+    return None
+
+def page_build():
+    """Build of the modules, templates and asset sources pages are rendered from"""
+    root = app.root_path
+    return source_build([os.path.join(root, name) for name in sorted(os.listdir(root)) if name.endswith('.py')]
+                        + [os.path.join(root, app.template_folder)]
+                        + [os.path.join(app.static_folder, source) for source in ASSET_SOURCES])
+
+# Rendered public pages, invalidated by commits to the tables each page is declared to use
+page_cache = PageCache(page_cache_backend(), table_versions,
+                       max_age=app.config['PAGE_CACHE_MAX_AGE'],
+                       shared_max_age=app.config['PAGE_CACHE_SHARED_MAX_AGE'],
+                       on_lookup=lambda endpoint, hit: page_cache_lookups.inc(endpoint, 'hit' if hit else 'miss'),
+                       build=page_build())
+commit_hooks.append(page_cache.purge)
+
+# Query statistics of the requests served by this process, shown on the admin diagnostics page
+route_stats = RouteStats(app.config['N_PLUS_ONE_THRESHOLD'])
+
+def start_request_timer(sender, **extra):
+    # Sent before any before_request function, so requests the rate limiter refuses are timed too
+    g.request_started = time.perf_counter()
+
+request_started.connect(start_request_timer, app)
+
+@app.before_request
+def start_query_stats():
+    if app.config['SQL_STATS']:
+        g.query_recorder = start_recording()
+
+@app.after_request
+def record_query_stats(response):
+    recorder = g.get('query_recorder')
+    if recorder is None:
+        return response
+    # Queries of a streamed body run after this point and are not counted
+    elapsed = time.perf_counter() - g.request_started
+    endpoint = request.endpoint or ''
+    db_queries.inc(endpoint, amount=recorder.count)
+    db_query_time.inc(endpoint, amount=recorder.duration)
+    for shape, count, seconds in route_stats.record(request.endpoint, recorder, elapsed):
+        app.logger.warning('Possible N+1 in %s: %d runs (%.1f ms) of %s',
+                           request.endpoint, count, seconds * 1000, shape)
+    if app.config['SERVER_TIMING']:
+        response.headers.add('Server-Timing', f'db;dur={recorder.duration * 1000:.1f};desc="{recorder.count} queries"')
+        response.headers.add('Server-Timing', f'app;dur={elapsed * 1000:.1f}')
+    return response
+
+@app.after_request
+def record_request_metrics(response):
+    # Unmatched URLs share one label so scanners can't create series
+    endpoint = request.endpoint or 'unmatched'
+    http_requests.inc(endpoint, request.method, str(response.status_code))
+    http_latency.observe(time.perf_counter() - g.request_started, endpoint)
+    return response
+
+@app.teardown_request
+def stop_query_stats(exc):
+    recorder = g.pop('query_recorder', None)
+    if recorder is not None:
+        stop_recording(recorder)
+
+# Profiles of single requests, saved for the admin panel (see profiler.py)
+_profile_store = None
+
+def profile_store():
+    """The ProfileStore, created on first use: most processes never profile"""
+    global _profile_store
+    if _profile_store is None:
+        from profiler import ProfileStore
+        _profile_store = ProfileStore(app.config['PROFILE_FOLDER'], keep=app.config['PROFILE_KEEP'])
+    return _profile_store
+
+def profile_requested():
+    # The session is only read when asked for: reading it keeps the page cache from storing the page
+    parameter = app.config['PROFILE_PARAMETER']
+    if request.args.get(parameter) or request.headers.get('X-Profile'):
+        return bool(session.get('admin_logged_in'))
+    rate = app.config['PROFILE_SAMPLE_RATE']
+    return rate > 0 and request.endpoint != 'static' and random.random() < rate
+
+def start_profile(sender, **extra):
+    if not profile_requested():
+        return
+    from profiler import Profile
+    profile = Profile(threading.get_ident(), app.config['PROFILE_INTERVAL'], root=app.root_path + os.sep)
+    if not app.config['SQL_STATS']:
+        profile.recorder = start_recording()
+    g.profile = profile
+    g.profile_name = profile_store().new_name(request.endpoint)
+    profile.start()
+
+request_started.connect(start_profile, app)
+
+def profile_template_started(sender, template, context, **extra):
+    profile = g.get('profile')
+    if profile is not None:
+        profile.template_started(template.name)
+
+def profile_template_finished(sender, template, context, **extra):
+    profile = g.get('profile')
+    if profile is not None:
+        profile.template_finished()
+
+before_render_template.connect(profile_template_started, app)
+template_rendered.connect(profile_template_finished, app)
+
+@app.after_request
+def mark_profiled_response(response):
+    if g.get('profile') is not None:
+        g.profile_status = response.status_code
+        response.headers['X-Profile'] = g.profile_name
+    return response
+
+@app.teardown_request
+def save_profile(exc):
+    # Runs before stop_query_stats (teardowns run in reverse), while g.query_recorder is still set
+    profile = g.pop('profile', None)
+    if profile is None:
+        return
+    profile.stop()
+    if profile.recorder is not None:
+        stop_recording(profile.recorder)
+    else:
+        profile.recorder = g.get('query_recorder')
+    try:
+        profile_store().save(g.profile_name, profile, profile.summary(
+            method=request.method, path=request.full_path.rstrip('?'), endpoint=request.endpoint,
+            status=500 if exc is not None else g.get('profile_status'),
+            created=datetime.now().isoformat(timespec='seconds'), pid=os.getpid()))
+    except OSError:
+        app.logger.exception('Could not save profile %s', g.profile_name)
+
+# Background workers of this process, started by its first request
+@app.before_request
+def start_image_jobs():
+    # Pick up jobs and tombstones left by a previous run; a no-op once started in this process
+    image_jobs.start()
+    upload_sweeper.start()
+    metrics.start()
+    if app.config['REQUEST_INTAKE'] == 'journal':
+        request_writer.start()
+
+# Minified, fingerprinted and precompressed copies of the site's CSS and JS (see assets.py)
+asset_manifest = AssetManifest(app.static_folder)
+
+@app.url_defaults
+def link_built_assets(endpoint, values):
+    # In debug mode the sources are linked, so edits show up without a rebuild
+    if endpoint == 'static' and app.config['BUILT_ASSETS'] and not app.debug:
+        built = asset_manifest.resolve(values.get('filename'))
+        if built is not None:
+            values['filename'] = built
+
+@app.before_request
+def serve_precompressed_asset():
+    if request.endpoint != 'static' or not AssetManifest.is_built(request.view_args['filename']):
+        return None
+    filename = request.view_args['filename']
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if request.accept_encodings[encoding] and os.path.isfile(os.path.join(app.static_folder, filename + suffix)):
+            response = send_from_directory(app.static_folder, filename + suffix,
+                                           mimetype=mimetypes.guess_type(filename)[0])
+            response.content_encoding = encoding
+            return response
+    return None
+
+@app.after_request
+def cache_stored_uploads(response):
+    # Content-addressed files and built assets never change, so clients and CDNs may keep them forever
+    if request.endpoint == 'static' and response.status_code in (200, 304):
+        filename = request.view_args.get('filename', '')
+        built = AssetManifest.is_built(filename)
+        if built or filename.startswith('uploads/') and is_blob_name(filename[len('uploads/'):]):
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = 31536000
+            response.cache_control.immutable = True
+        if built:
+            response.vary.add('Accept-Encoding')
+    return response
+
+# Image URLs of rows, for the templates
+app.add_template_global(image_sources)
+app.add_template_global(image_url)
+
+# Reference data cache
+def snapshot_rows(model):
+    """Detached read-only copies of every row of model, in id order"""
+    columns = [attr.key for attr in inspect(model).column_attrs]
+    # A fresh session, so the rows can't predate the version they are cached under
+    with Session(db.engine) as reader:
+        rows = reader.scalars(select(model).order_by(model.id)).all()
+        return tuple(SimpleNamespace(**{key: getattr(row, key) for key in columns}) for row in rows)
+
+reference_cache = ReferenceCache(table_versions,
+                                 on_lookup=lambda name, hit: reference_cache_lookups.inc(name, 'hit' if hit else 'miss'))
+for name, model in (('categories', Category), ('galleries', Gallery), ('tags', PhotoTag)):
+    reference_cache.register(name, lambda model=model: snapshot_rows(model), [model.__table__.name])
+
+def cached_categories():
+    return reference_cache.get('categories')
+
+def cached_galleries():
+    return reference_cache.get('galleries')
+
+def cached_tags():
+    return reference_cache.get('tags')
+
+def category_choices():
+    return [(c.id, c.name) for c in cached_categories()]
+
+def gallery_choices():
+    return [('', 'Без галереи')] + [(g.id, g.name) for g in cached_galleries()]